@@ -1,23 +1,41 @@
 import datetime
+import aiohttp
+import aiohttp.web
+import array
 import asyncio
+import bisect
+import collections
+import contextlib
+import difflib
+import heapq
+import itertools
+import threading
+import time
 import tabulate
 import csv
+import io
 import gspread
 import discord
 import os
 import mysql.connector
+import mysql.connector.pooling
 import logging
+import math
 import re
-import requests
+import sqlite3
 import json
 import logging.handlers
 
 from oauth2client.service_account import ServiceAccountCredentials
-from typing import List
-from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
 from discord.ext import commands
 from dotenv import load_dotenv
 
+try:
+    import ijson
+except ImportError:  # Battle boards are parsed with json.loads instead
+    ijson = None
+
 # Load environment variables from a .env file
 load_dotenv()
 
@@ -32,16 +50,422 @@ file_handler.setFormatter(formatter)
 
 logger.addHandler(file_handler)
 
-bot = commands.Bot(command_prefix='#', case_insensitive=True, intents=discord.Intents.all())
+
+class Bot(commands.Bot):
+    """The bot, starting the background services on login and closing the shared HTTP clients on shutdown."""
+
+    async def setup_hook(self):
+        # Countdowns that ended while the bot was offline expire right away
+        restore_countdowns()
+        asyncio.get_running_loop().create_task(render_restored_lists())
+
+        asyncio.get_running_loop().create_task(monitor_event_loop())
+        try:
+            await start_metrics_server()
+        except OSError as e:
+            logger.error(f"Failed to start the metrics endpoint: {e}")
+
+        # Load the user directory in the background and keep it reconciled with the database
+        asyncio.get_running_loop().create_task(reconcile_user_directory())
+
+        try:
+            await setup_ledger()
+        except Exception as e:
+            logger.error(f"Failed to set up the balance ledger: {e}")
+
+    async def close(self):
+        try:
+            await battle_board.close()
+        finally:
+            await super().close()
+
+
+bot = Bot(command_prefix='#', case_insensitive=True, intents=discord.Intents.all())
 active_countdowns_file = 'wb_countdown.json'
-list_message_id_wb = None
 countdown_links_wb = {}
 
-list_message_id = None
 countdown_links = {}
 allowed_channel_ids = [1215353680539418686, 1112675424229670995, 1215353688579772417, 1170411419850788936]
 
 
+class Histogram:
+    """Cumulative latency buckets in seconds, in the layout Prometheus expects."""
+
+    buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.buckets) + 1)  # the last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile; inf when it falls past the last bucket."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+
+class Metrics:
+    """Counters, latency histograms and gauges for the `metrics` command and the Prometheus text dump.
+
+    Everything is recorded from the event loop, so no locking is needed. Gauges are callables read at render time.
+    """
+
+    def __init__(self):
+        self.counters = collections.Counter()  # (name, labels) -> count
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.gauges = {}  # name -> callable
+
+    def increment(self, name, amount=1, **labels):
+        self.counters[name, tuple(sorted(labels.items()))] += amount
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        if key not in self.histograms:
+            self.histograms[key] = Histogram()
+        self.histograms[key].observe(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def gauge(self, name, read):
+        self.gauges[name] = read
+
+    def hit_rate(self, cache):
+        hits = self.counters['cache_requests_total', (('cache', cache), ('result', 'hit'))]
+        misses = self.counters['cache_requests_total', (('cache', cache), ('result', 'miss'))]
+        return hits / (hits + misses) if hits + misses else None
+
+    @staticmethod
+    def _labels(labels, **extra):
+        pairs = list(labels) + sorted(extra.items())
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+        for (name, labels), value in sorted(self.counters.items()):
+            lines.append(f"{name}{self._labels(labels)} {value}")
+        for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+            cumulative = 0
+            for bound, count in zip((*histogram.buckets, '+Inf'), histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{self._labels(labels, le=bound)} {cumulative}")
+            lines.append(f"{name}_sum{self._labels(labels)} {histogram.sum:.6f}")
+            lines.append(f"{name}_count{self._labels(labels)} {histogram.count}")
+        for name, read in sorted(self.gauges.items()):
+            try:
+                lines.append(f"{name} {read()}")
+            except Exception as e:
+                logger.error(f"Failed to read gauge {name}: {e}")
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+class BlockingPool:
+    """Thread pool for one kind of blocking work, such as Google Sheets calls or MySQL queries.
+
+    At most ``limit`` calls may be queued or running at once; further callers wait on the event loop instead of
+    piling up in the executor queue, so a burst of slow calls of one kind never starves the others.
+    """
+
+    def __init__(self, name, workers, limit=None):
+        self.name = name
+        self.workers = workers
+        self.limit = limit or 4 * workers
+        self.pending = 0
+        self._semaphore = asyncio.Semaphore(self.limit)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+
+    async def run(self, func, *args):
+        queued = time.perf_counter()
+        async with self._semaphore:
+            metrics.observe('blocking_queue_wait_seconds', time.perf_counter() - queued, pool=self.name)
+            self.pending += 1
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+            finally:
+                self.pending -= 1
+
+    def submit(self, func, *args):
+        """Queue a call without waiting for it; calls on a single-worker pool run in submission order."""
+        return self._executor.submit(func, *args)
+
+
+# Blocking work is split by kind so that each kind is bounded separately
+network_pool = BlockingPool('network', int(os.getenv('NETWORK_WORKERS', '8')))
+cpu_pool = BlockingPool('cpu', int(os.getenv('CPU_WORKERS', min(4, os.cpu_count() or 1))))
+disk_pool = BlockingPool('disk', 1)
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate  # tokens per second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """Seconds until a token is available; 0 when one is available now."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class OutboundAction:
+    def __init__(self, priority, seq, route, key, func, args, kwargs):
+        self.priority = priority
+        self.seq = seq
+        self.route = route
+        self.key = key
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.queued_at = time.monotonic()
+        self.cancelled = False
+        self.future = asyncio.get_running_loop().create_future()
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class MessageRegistry:
+    """What each recent bot message is, keyed by message ID.
+
+    Only kinds in ``deletable`` get the ❌ button, so paginated tables, list embeds and chunked output don't cost an
+    extra reaction per message. The registry keeps the ``max_messages`` most recent entries; messages from before a
+    restart are unknown and treated as deletable, as they were before.
+    """
+
+    deletable = frozenset({'reply', 'countdown', 'wb_countdown'})
+
+    def __init__(self, max_messages=10000):
+        self.max_messages = max_messages
+        self._kinds = collections.OrderedDict()
+
+    def record(self, message_id, kind):
+        self._kinds[message_id] = kind
+        self._kinds.move_to_end(message_id)
+        if len(self._kinds) > self.max_messages:
+            self._kinds.popitem(last=False)
+
+    def kind(self, message_id):
+        return self._kinds.get(message_id)
+
+    def is_deletable(self, message_id):
+        return self._kinds.get(message_id, 'reply') in self.deletable
+
+    def forget(self, message_id):
+        self._kinds.pop(message_id, None)
+
+
+bot_messages = MessageRegistry()
+
+
+class OutboundQueue:
+    """Single dispatcher for every message, edit, reaction and delete the bot sends to Discord.
+
+    Actions are queued per route (kind of call and channel), and each route has a token bucket sized a little under
+    Discord's own limits, so bursts wait here instead of behind discord.py's global rate-limit lock. A route runs one
+    action at a time, which keeps a channel's actions in order, and at most ``concurrency`` routes run at once; when
+    more are ready, replies go before edits, and edits before cosmetic reactions. A pending edit absorbs later edits
+    of the same message, duplicate reactions share one call, and deleting a message drops whatever is still queued
+    for it. Sent messages are recorded in `bot_messages`, and the deletable kinds get their ❌ queued right away.
+    """
+
+    REPLY, EDIT, DELETE, REACTION = range(4)
+
+    # kind -> (priority, tokens per second, burst)
+    limits = {
+        'send': (REPLY, 1.0, 5),
+        'edit': (EDIT, 1.0, 5),
+        'delete': (DELETE, 2.0, 5),
+        'reaction': (REACTION, 3.0, 1),
+    }
+
+    def __init__(self, concurrency=4):
+        self.concurrency = concurrency
+        self._routes = {}  # route -> heap of OutboundAction
+        self._buckets = {}  # route -> TokenBucket
+        self._busy = set()  # routes with an action in flight
+        self._by_key = {}  # coalescing key -> queued OutboundAction
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._task = None
+
+    def __len__(self):
+        return sum(len(heap) for heap in self._routes.values())
+
+    def _enqueue(self, kind, channel_id, key, func, *args, **kwargs):
+        action = self._by_key.get(key) if key is not None else None
+        if action is not None:
+            # The queued call already does this; a later edit's fields win
+            action.kwargs.update(kwargs)
+            metrics.increment('discord_actions_coalesced_total', kind=kind)
+            return action.future
+
+        priority, rate, burst = self.limits[kind]
+        route = (kind, channel_id)
+        action = OutboundAction(priority, next(self._seq), route, key, func, args, kwargs)
+        heapq.heappush(self._routes.setdefault(route, []), action)
+        if route not in self._buckets:
+            self._buckets[route] = TokenBucket(rate, burst)
+        if key is not None:
+            self._by_key[key] = action
+
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._dispatch())
+        self._wakeup.set()
+        return action.future
+
+    async def _submit(self, kind, channel_id, key, func, *args, **kwargs):
+        # Shielded because several callers may share the future of a coalesced action
+        return await asyncio.shield(self._enqueue(kind, channel_id, key, func, *args, **kwargs))
+
+    def _drop(self, key):
+        action = self._by_key.pop(key, None)
+        if action is not None:
+            action.cancelled = True
+            action.future.set_result(None)
+
+    async def send(self, destination, *args, kind='reply', **kwargs):
+        # Either a context or a channel
+        channel = getattr(destination, 'channel', destination)
+        return self._sent(await self._submit('send', channel.id, None, destination.send, *args, **kwargs), kind)
+
+    async def reply(self, message, *args, kind='reply', **kwargs):
+        return self._sent(await self._submit('send', message.channel.id, None, message.reply, *args, **kwargs), kind)
+
+    def _sent(self, message, kind):
+        bot_messages.record(message.id, kind)
+        if kind in bot_messages.deletable:
+            # The caller doesn't wait for the cosmetic reaction
+            self._enqueue('reaction', message.channel.id, ('reaction', message.id, "❌"), message.add_reaction,
+                          "❌").add_done_callback(self._log_failure)
+        return message
+
+    @staticmethod
+    def _log_failure(future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Failed to add a reaction: {future.exception()}")
+
+    async def edit(self, message, **fields):
+        return await self._submit('edit', message.channel.id, ('edit', message.id), message.edit, **fields)
+
+    async def add_reaction(self, message, emoji):
+        return await self._submit('reaction', message.channel.id, ('reaction', message.id, str(emoji)),
+                                  message.add_reaction, emoji)
+
+    async def remove_reaction(self, reaction, user):
+        message = reaction.message
+        return await self._submit('reaction', message.channel.id, ('unreact', message.id, str(reaction.emoji), user.id),
+                                  reaction.remove, user)
+
+    async def delete(self, message):
+        # Nothing still queued for a deleted message can succeed
+        for key in [key for key in self._by_key if key[0] != 'delete' and key[1] == message.id]:
+            self._drop(key)
+        return await self._submit('delete', message.channel.id, ('delete', message.id), message.delete)
+
+    def _next_ready(self, now):
+        """Return the best action that may run now, or None and the seconds until one may."""
+        best = None
+        wait = None
+        for route, heap in list(self._routes.items()):
+            while heap and heap[0].cancelled:
+                heapq.heappop(heap)
+            if not heap:
+                del self._routes[route]
+                continue
+            if route in self._busy:
+                continue
+            route_wait = self._buckets[route].wait_time(now)
+            if route_wait:
+                wait = route_wait if wait is None else min(wait, route_wait)
+            elif best is None or heap[0] < best:
+                best = heap[0]
+
+        # Forget buckets that have refilled and have nothing queued
+        for route in [route for route, bucket in self._buckets.items()
+                      if route not in self._routes and route not in self._busy and bucket.full(now)]:
+            del self._buckets[route]
+        return best, wait
+
+    async def _dispatch(self):
+        while True:
+            self._wakeup.clear()
+            action = None
+            wait = None
+            if len(self._busy) < self.concurrency:
+                action, wait = self._next_ready(time.monotonic())
+            if action is None:
+                if not self._routes and not self._busy:
+                    return
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._routes[action.route])
+            if self._by_key.get(action.key) is action:
+                del self._by_key[action.key]
+            self._buckets[action.route].take(time.monotonic())
+            self._busy.add(action.route)
+            asyncio.get_running_loop().create_task(self._run(action))
+
+    async def _run(self, action):
+        kind = action.route[0]
+        metrics.observe('discord_action_queue_seconds', time.monotonic() - action.queued_at, kind=kind)
+        try:
+            with metrics.timer('discord_action_duration_seconds', kind=kind):
+                result = await action.func(*action.args, **action.kwargs)
+        except Exception as e:
+            if not action.future.done():
+                action.future.set_exception(e)
+        else:
+            if not action.future.done():
+                action.future.set_result(result)
+        finally:
+            self._busy.discard(action.route)
+            self._wakeup.set()
+
+
+outbound = OutboundQueue(int(os.getenv('DISCORD_ACTION_CONCURRENCY', '4')))
+
+
 class CustomEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, (datetime.datetime, datetime.date)):
@@ -49,41 +473,290 @@ class CustomEncoder(json.JSONEncoder):
         return super().default(obj)
 
 
-# Load active_countdowns from the JSON file if it exists
-try:
-    with open('active_countdowns.json', 'r') as json_file:
-        loaded_countdowns = json.load(json_file)
-        # Convert loaded datetime strings to datetime objects
-        active_countdowns = {key: (datetime.datetime.fromisoformat(value[0]), value[1], value[2]) for key, value in
-                             loaded_countdowns.items()}
-except (FileNotFoundError, json.JSONDecodeError):
-    logging.error("Error loading countdowns from file")
-    active_countdowns = {}  # Initialize an empty dictionary if the file doesn't exist or is empty
-
-# Load active_countdowns from the JSON file
-try:
-    with open('wb_countdown.json', 'r') as json_file:
-        active_countdowns_wb = json.load(json_file)
-except FileNotFoundError:
-    print("Error loading countdowns from file")
-    active_countdowns_wb = {}
+class CountdownJournal:
+    """Append-only log of countdown additions and removals.
 
-# Load active_countdowns from the JSON file if it exists
-try:
-    with open('wb_countdown.json', 'r') as json_file:
-        loaded_countdowns = json.load(json_file)
-        active_countdowns_wb = {}
+    Every mutation appends one JSON line from the single disk thread, so the event loop never waits on the
+    file and writes stay in order. Once removed records outnumber the live ones, the journal is compacted into a
+    temporary file that atomically replaces it.
+    """
+
+    def __init__(self, path, legacy_path):
+        self.path = path
+        self.legacy_path = legacy_path
+        self._live = {}
+        self._records = 0
+        self._file = None
+
+    def load(self):
+        """Replay the journal and return ``{message_id: record}`` for every live countdown."""
+        records = {}
+        migrated = False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as journal_file:
+                for line in journal_file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A crash can leave the last line half written
+                        logger.error(f"Skipping damaged line in {self.path}: {line!r}")
+                        continue
+                    self._records += 1
+                    if record.get('op') == 'add':
+                        records[record['id']] = record
+                    elif record.get('op') == 'del':
+                        records.pop(record['id'], None)
+        except FileNotFoundError:
+            records = self._load_legacy()
+            migrated = True
+
+        self._live = {message_id: json.dumps(record) for message_id, record in records.items()}
+        if migrated or self._needs_compaction():
+            self._rewrite(list(self._live.values()))
+            self._records = len(self._live)
+        return records
+
+    def _load_legacy(self):
+        # Import the full JSON snapshot written by earlier versions of the bot
+        try:
+            with open(self.legacy_path, 'r') as json_file:
+                loaded_countdowns = json.load(json_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+        records = {}
         for key, value in loaded_countdowns.items():
-            if isinstance(value, list) or isinstance(value, tuple):
-                if len(value) >= 3:
-                    active_countdowns_wb[key] = (datetime.datetime.fromisoformat(value[0]), value[1], value[2])
-                else:
-                    print(f"Invalid countdown format for key {key}: {value}")
+            if isinstance(value, (list, tuple)) and len(value) >= 3:
+                records[int(key)] = {'op': 'add', 'id': int(key), 'end': value[0], 'author': None,
+                                     'name': value[2], 'channel': None, 'link': None}
             else:
-                print(f"Invalid countdown format for key {key}: {value}")
-except (FileNotFoundError, json.JSONDecodeError):
-    print("Error loading countdowns from file")
-    active_countdowns_wb = {}
+                logger.error(f"Invalid countdown format for key {key}: {value}")
+        return records
+
+    def record_add(self, message_id, end_time, author_id, custom_name, channel_id, link):
+        line = json.dumps({'op': 'add', 'id': message_id, 'end': end_time.isoformat(), 'author': author_id,
+                           'name': custom_name, 'channel': channel_id, 'link': link})
+        self._live[message_id] = line
+        self._append(line)
+
+    def record_remove(self, message_id):
+        if self._live.pop(message_id, None) is not None:
+            self._append(json.dumps({'op': 'del', 'id': message_id}))
+
+    def _needs_compaction(self):
+        return self._records > 2 * len(self._live) + 100
+
+    def _append(self, line):
+        self._records += 1
+        if self._needs_compaction():
+            # The snapshot already contains this mutation
+            self._records = len(self._live)
+            disk_pool.submit(self._rewrite, list(self._live.values()))
+        else:
+            disk_pool.submit(self._write, line)
+
+    def _write(self, line):
+        try:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(line + '\n')
+            self._file.flush()
+        except OSError as e:
+            logger.error(f"Failed to append to {self.path}: {e}")
+
+    def _rewrite(self, lines):
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as tmp_file:
+                tmp_file.writelines(line + '\n' for line in lines)
+                tmp_file.flush()
+                os.fsync(tmp_file.fileno())
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Failed to compact {self.path}: {e}")
+
+
+active_countdowns = {}
+active_countdowns_wb = {}
+countdown_journals = {
+    'content': CountdownJournal('active_countdowns.journal', 'active_countdowns.json'),
+    'wb': CountdownJournal('wb_countdown.journal', 'wb_countdown.json'),
+}
+
+
+# Convert a countdown end time to a UTC timestamp; naive datetimes (from `wb`) are treated as UTC
+def countdown_deadline(end_time):
+    if end_time.tzinfo is None:
+        end_time = end_time.replace(tzinfo=datetime.timezone.utc)
+    return end_time.timestamp()
+
+
+class CountdownScheduler:
+    """One task for every countdown: a heap of end times that sleeps until the nearest deadline."""
+
+    def __init__(self, on_expire):
+        self._on_expire = on_expire
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, message_id):
+        return message_id in self._entries
+
+    def schedule(self, message_id, end_time):
+        """Call ``on_expire(message_id)`` once ``end_time`` is reached."""
+        entry = (countdown_deadline(end_time), next(self._counter), message_id)
+        self._entries[message_id] = entry
+        heapq.heappush(self._heap, entry)
+        self._wake()
+
+    def cancel(self, message_id):
+        """Forget a countdown without running the expiry callback."""
+        if self._entries.pop(message_id, None) is None:
+            return False
+        self._wake()
+        return True
+
+    def _wake(self):
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def _pop_stale(self):
+        # Cancelled entries are removed lazily; rebuild the heap when they start to dominate it
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = list(self._entries.values())
+            heapq.heapify(self._heap)
+        while self._heap:
+            if self._entries.get(self._heap[0][2]) is self._heap[0]:
+                return
+            heapq.heappop(self._heap)
+
+    async def _expire(self, message_id):
+        try:
+            await self._on_expire(message_id)
+        except Exception as e:
+            logger.error(f"Countdown {message_id} failed to expire: {e}")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            self._pop_stale()
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                _, _, message_id = heapq.heappop(self._heap)
+                del self._entries[message_id]
+                loop.create_task(self._expire(message_id))
+                self._pop_stale()
+
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._heap[0][0] - now)
+            except asyncio.TimeoutError:
+                pass
+
+
+# Everything needed to finish a countdown, kept by the message id of the countdown reply
+class CountdownHandle:
+    def __init__(self, kind, message_id, channel_id, author_id):
+        self.kind = kind  # 'content' or 'wb'
+        self.message_id = message_id
+        self.channel_id = channel_id
+        self.author_id = author_id
+
+
+# Message id -> CountdownHandle for every live countdown, filled in by `content_in` and `wb`
+countdown_handles = {}
+
+
+def countdowns_for(kind):
+    return active_countdowns_wb if kind == 'wb' else active_countdowns
+
+
+def countdown_links_for(kind):
+    return countdown_links_wb if kind == 'wb' else countdown_links
+
+
+def countdown_channel(handle):
+    return bot.get_channel(handle.channel_id) or bot.get_partial_messageable(handle.channel_id)
+
+
+# Add a countdown to its dictionary, the reaction index, the journal and the scheduler
+def register_countdown(kind, message_id, channel_id, author_id, end_time, custom_name, link, journal=True):
+    countdowns_for(kind)[message_id] = (end_time, author_id, custom_name)
+    if link:
+        countdown_links_for(kind)[message_id] = link
+    countdown_handles[message_id] = CountdownHandle(kind, message_id, channel_id, author_id)
+    bot_messages.record(message_id, 'wb_countdown' if kind == 'wb' else 'countdown')
+    if journal:
+        countdown_journals[kind].record_add(message_id, end_time, author_id, custom_name, channel_id, link)
+    countdown_scheduler.schedule(message_id, end_time)
+
+
+# Drop a countdown from everything register_countdown put it in
+def discard_countdown(kind, message_id):
+    countdown_handles.pop(message_id, None)
+    countdowns_for(kind).pop(message_id, None)
+    countdown_links_for(kind).pop(message_id, None)
+    countdown_scheduler.cancel(message_id)
+    countdown_journals[kind].record_remove(message_id)
+
+
+# Rebuild both dictionaries from the journals and reschedule every live countdown
+def restore_countdowns():
+    for kind, journal in countdown_journals.items():
+        for message_id, record in journal.load().items():
+            register_countdown(kind, message_id, record['channel'], record['author'],
+                               datetime.datetime.fromisoformat(record['end']), record['name'], record['link'],
+                               journal=False)
+
+
+# Redraw both list messages once the bot is connected, in the channel of the latest restored countdown of each kind
+async def render_restored_lists():
+    await bot.wait_until_ready()
+    for kind, update in (('content', update_list_message), ('wb', update_list_message_wb)):
+        handles = [handle for handle in countdown_handles.values() if handle.kind == kind and handle.channel_id]
+        if handles:
+            await update(countdown_channel(handles[-1]))
+
+
+# Remove a countdown and refresh the list message it belongs to
+async def end_countdown(handle, expired):
+    discard_countdown(handle.kind, handle.message_id)
+
+    # Countdowns imported from the old JSON files don't know their channel
+    if handle.channel_id is None:
+        return
+
+    channel = countdown_channel(handle)
+    if handle.kind == 'wb':
+        await update_list_message_wb(channel)
+    else:
+        await update_list_message(channel)
+
+    if expired:
+        # Edit the original countdown message when the countdown is done
+        await outbound.edit(channel.get_partial_message(handle.message_id), content="6. Content ended!")
+
+
+async def expire_countdown(message_id):
+    handle = countdown_handles.get(message_id)
+    if handle is not None:
+        await end_countdown(handle, expired=True)
+
+
+countdown_scheduler = CountdownScheduler(expire_countdown)
 
 
 # Define the function for splitting messages
@@ -118,61 +791,136 @@ def member_or_trial(user):
         or eu_release == eu_release.lower() for role_name in lowercase_roles)
 
 
+metrics_file = os.getenv('METRICS_FILE', 'metrics.prom')
+metrics_dump_interval = int(os.getenv('METRICS_DUMP_SECONDS', '60'))
+event_loop_lag = 0.0
+event_loop_lag_max = 0.0
+
+
+# Function to write the Prometheus text dump, replacing the previous one atomically
+def write_metrics_file(text):
+    tmp_path = metrics_file + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as tmp_file:
+            tmp_file.write(text)
+        os.replace(tmp_path, metrics_file)
+    except OSError as e:
+        logger.error(f"Failed to write {metrics_file}: {e}")
+
+
+# Function to measure how late the event loop wakes up, and to dump the metrics periodically
+async def monitor_event_loop(interval=0.5):
+    global event_loop_lag, event_loop_lag_max
+    loop = asyncio.get_running_loop()
+    dumped_at = loop.time()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        event_loop_lag = max(0.0, loop.time() - started - interval)
+        event_loop_lag_max = max(event_loop_lag_max, event_loop_lag)
+        metrics.observe('event_loop_lag_seconds', event_loop_lag)
+
+        if metrics_file and loop.time() - dumped_at >= metrics_dump_interval:
+            dumped_at = loop.time()
+            disk_pool.submit(write_metrics_file, metrics.render())
+
+
+# Function to serve the metrics on a local port for a Prometheus scraper, when METRICS_PORT is set
+async def start_metrics_server():
+    port = os.getenv('METRICS_PORT')
+    if not port:
+        return
+
+    async def handle_metrics(request):
+        return aiohttp.web.Response(text=metrics.render(), content_type='text/plain', charset='utf-8')
+
+    app = aiohttp.web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = aiohttp.web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await aiohttp.web.TCPSite(runner, os.getenv('METRICS_HOST', '127.0.0.1'), int(port)).start()
+
+
+@bot.event
+async def on_command(ctx):
+    ctx.started_at = time.perf_counter()
+
+
+# Function to record how long a command took and how it ended
+def record_command(ctx, status):
+    started_at = getattr(ctx, 'started_at', None)
+    if ctx.command is not None and started_at is not None:
+        metrics.observe('command_duration_seconds', time.perf_counter() - started_at,
+                        command=ctx.command.qualified_name, status=status)
+
+
+@bot.event
+async def on_command_completion(ctx):
+    record_command(ctx, 'ok')
+
+
+@bot.event
+async def on_command_error(ctx, error):
+    record_command(ctx, 'error')
+    if isinstance(error, (commands.CommandNotFound, commands.CheckFailure)):
+        return
+    logger.error(f"Command {ctx.command} failed: {error}", exc_info=error)
+
+
 @bot.event
 async def on_message(message):
-    # Check if the message is a command and process it
+    # Check if the message is a command and process it; the ❌ on bot messages is added when they are sent
     await bot.process_commands(message)
 
-    # Check if the message is from the bot and not the loot_logger command
-    if message.author == bot.user and not message.content.startswith('!loot_logger'):
-        # Add the ❌ reaction to the bot message
-        await message.add_reaction("❌")
-
 
 @bot.event
 async def on_reaction_add(reaction, user):
-    # Check if the reaction is "❌" and the user is not a bot
-    if str(reaction.emoji) == "❌" and not user.bot:
-        try:
-            # Fetch the message to make sure it still exists
-            original_message = await reaction.message.channel.fetch_message(reaction.message.id)
+    # Page buttons on a paginated message
+    if not user.bot:
+        await paginations.handle_reaction(reaction, user)
 
-            # Check if the message is already deleted or if the bot doesn't have permission to delete messages
-            if original_message is not None and original_message.author.bot:
-                try:
-                    await original_message.delete()
-                except discord.NotFound:
-                    pass
-                except Exception as e:
-                    pass
 
-            if original_message is not None and original_message.author.bot:
-                try:
-                    await original_message.delete()
-                except discord.NotFound:
-                    pass
-                except Exception as e:
-                    pass
+# Forget deleted messages, whoever deleted them, so their page state doesn't wait for the idle timeout
+@bot.event
+async def on_raw_message_delete(payload):
+    paginations.discard(payload.message_id)
+    bot_messages.forget(payload.message_id)
 
-                # Remove the countdown from the dictionary
-                del active_countdowns[original_message.id]
 
-                # Introduce a short delay before updating the list
-                await asyncio.sleep(1)
+# The ❌ is handled from the raw event, which also fires for messages that aren't in the message cache, such as
+# countdowns restored after a restart
+@bot.event
+async def on_raw_reaction_add(payload):
+    # Check if the reaction is "❌" and the user is not a bot
+    if str(payload.emoji) != "❌" or payload.user_id == bot.user.id or (payload.member and payload.member.bot):
+        return
 
-                # Update the list message
-                updated_list_message = await update_list_message(original_message.channel)
+    message_id = payload.message_id
+    handle = countdown_handles.get(message_id)
+    if handle is None and bot_messages.kind(message_id) is None:
+        # Messages from before a restart aren't registered; the payload names their author from discord.py 2.4 on
+        if getattr(payload, 'message_author_id', None) != bot.user.id:
+            return
+    if not bot_messages.is_deletable(message_id):
+        return
 
-                # Update the list_message_id variable
-                list_message_id = updated_list_message
-                # Update the list message
-                updated_list_message_wb = await update_list_message_wb(original_message.channel)
+    # Deleting needs only the IDs, so the message is never fetched
+    original_message = bot.get_partial_messageable(payload.channel_id).get_partial_message(message_id)
+    try:
+        await outbound.delete(original_message)
+    except discord.NotFound:
+        pass
+    except Exception as e:
+        logger.error(f"Failed to delete message {message_id}: {e}")
 
-                # Update the list_message_id variable
-                list_message_id = updated_list_message_wb
+    bot_messages.forget(message_id)
 
+    # Only a countdown has a list message to refresh, and its handle says which one
+    if handle is not None:
+        try:
+            await end_countdown(handle, expired=False)
         except Exception as e:
-            print(e)
+            logger.error(f"Failed to cancel countdown {message_id}: {e}")
 
 
 @bot.command(name="remove")
@@ -187,17 +935,17 @@ async def remove_countdown(ctx, index: str):
             # Get the message_id of the countdown to be removed
             message_id_to_remove = list(active_countdowns.keys())[index - 1]
 
-            # Remove the countdown from the dictionary
-            del active_countdowns[message_id_to_remove]
+            # Remove the countdown from the dictionary, the scheduler and the journal
+            discard_countdown('content', message_id_to_remove)
 
             # Update the list message
             await update_list_message(ctx.channel)
 
         else:
-            await ctx.send("Invalid index. Please provide a valid index.")
+            await outbound.send(ctx, "Invalid index. Please provide a valid index.")
     except Exception as e:
         logging.error(f"An error occurred: {str(e)}")
-        await ctx.send("An error occurred while trying to remove the countdown.")
+        await outbound.send(ctx, "An error occurred while trying to remove the countdown.")
 
 
 @bot.command(name="content_in")
@@ -205,21 +953,9 @@ async def remove_countdown(ctx, index: str):
 async def content_in(ctx, time_str: str, *, custom_name: str = ""):
     try:
         if ctx.channel.id not in allowed_channel_ids:
-            await ctx.send("4. This command is not allowed in this channel.")
+            await outbound.send(ctx, "4. This command is not allowed in this channel.")
             return
 
-        # Load active_countdowns from the JSON file if it hasn't been loaded yet
-        if not active_countdowns:
-            try:
-                with open('active_countdowns.json', 'r') as json_file:
-                    loaded_countdowns = json.load(json_file)
-                    # Convert loaded datetime strings to datetime objects
-                    active_countdowns.update(
-                        {key: (datetime.datetime.fromisoformat(value[0]), value[1], value[2]) for key, value in
-                         loaded_countdowns.items()})
-            except (FileNotFoundError, json.JSONDecodeError):
-                logging.error("5. Error loading countdowns from file")
-
         # Parse input time (hours:minutes)
         hours, minutes = map(int, time_str.split(':'))
         total_seconds = hours * 3600 + minutes * 60
@@ -240,67 +976,80 @@ async def content_in(ctx, time_str: str, *, custom_name: str = ""):
         countdown_message = f"Countdown will end: {discord_timestamp} {formatted_time} UTC"
 
         # Reply to the user's message with the countdown message
-        response_message = await ctx.message.reply(countdown_message)
-
-        # Add "❌" emoji reaction to the response message
-        await response_message.add_reaction("❌")
+        response_message = await outbound.reply(ctx.message, countdown_message, kind='countdown')
 
-        def check_reaction(reaction, user):
-            return str(reaction.emoji) == "❌" and reaction.message.id == response_message.id and user == ctx.author
-
-        # Add countdown information to the active_countdowns dictionary with custom name
-        active_countdowns[response_message.id] = (end_time, ctx.author, custom_name)
-
-        countdown_links[response_message.id] = response_message.jump_url
+        # Add countdown information to the active_countdowns dictionary with custom name, journal it and let the
+        # scheduler wake us at the end time instead of polling every second
+        register_countdown('content', response_message.id, ctx.channel.id, ctx.author.id, end_time, custom_name,
+                           response_message.jump_url)
 
         # Update the list message and pass the response_message.id
-        await update_list_message(ctx)
-
-        # Wait for the countdown to finish or until the user reacts with "❌" emoji
-        while end_time > datetime.datetime.now(datetime.UTC):
-            await asyncio.sleep(1)
-
-            try:
-                reaction, _ = await bot.wait_for("reaction_add", check=check_reaction, timeout=1)
-                # User reacted with "❌", stop the countdown
-                break
-            except asyncio.TimeoutError:
-                pass
-
-        # Remove the countdown from the dictionary once it expires
-        del active_countdowns[response_message.id]
-
-        # Update the list message
-        await update_list_message(ctx)
-
-        # Edit the original countdown message when the countdown is done
-        await response_message.edit(content="6. Content ended!")
+        await update_list_message(ctx.channel)
 
     except Exception as e:
         logging.error(f"An error occurred: {str(e)}")
 
 
-async def update_list_message(channel: discord.TextChannel) -> int:
-    global list_message_id
+class ListMessageRenderer:
+    """Keeps an "Active Countdowns" list message current by editing it in place.
+
+    Changes that arrive within ``delay`` seconds of each other are merged into a single render, and the API is
+    only called when the rendered embed differs from the one already shown.
+    """
 
-    # Check if the list message exists
-    if list_message_id:
+    def __init__(self, build_embed, kind, delay=2.0):
+        self._build_embed = build_embed
+        self._kind = kind
+        self._delay = delay
+        self._lock = asyncio.Lock()
+        self._pending = None
+        self._channel = None
+        self._rendered = None
+        self.message = None
+
+    def request(self, channel):
+        self._channel = channel
+        if self._pending is None:
+            self._pending = asyncio.get_running_loop().create_task(self._render_later())
+
+    async def _render_later(self):
+        await asyncio.sleep(self._delay)
+        # Anything requested from here on needs another render
+        self._pending = None
         try:
-            list_message = await channel.fetch_message(list_message_id)
-            await list_message.delete()
+            await self.render()
+        except Exception as e:
+            logger.error(f"Failed to update the countdown list message: {e}")
 
-        except discord.NotFound:
-            logging.error("7. Existing list message not found.")
+    async def render(self):
+        async with self._lock:
+            channel = self._channel
+            embed = self._build_embed()
+            rendered = embed.to_dict()
 
-    # Convert datetime objects to ISO format before saving to JSON
-    serialized_countdowns = {
-        key: (value[0].isoformat(), value[1], value[2]) for key, value in active_countdowns.items()
-    }
+            if self.message is not None and self.message.channel.id == channel.id:
+                if rendered == self._rendered:
+                    return
+                try:
+                    await outbound.edit(self.message, embed=embed)
+                    self._rendered = rendered
+                    return
+                except discord.NotFound:
+                    logger.error("7. Existing list message not found.")
+            elif self.message is not None:
+                # The list moves to the channel the latest countdown was started in
+                try:
+                    await outbound.delete(self.message)
+                except discord.NotFound:
+                    pass
+                bot_messages.forget(self.message.id)
 
-    # Save active_countdowns to a JSON file
-    with open('active_countdowns.json', 'w') as json_file:
-        json.dump(serialized_countdowns, json_file, default=str)
+            self.message = await outbound.send(channel, embed=embed, kind=self._kind)
+            self._rendered = rendered
 
+
+# Function to build the list embed for regular countdowns
+def build_list_embed():
     # Create a new list message with an embedded layout
     embed = discord.Embed(
         title="Active Countdowns",
@@ -326,10 +1075,15 @@ async def update_list_message(channel: discord.TextChannel) -> int:
                 inline=False
             )
 
-    # Send the new list message to the same channel
-    list_message = await channel.send(embed=embed)
-    list_message_id = list_message.id
-    return list_message_id
+    return embed
+
+
+list_renderer = ListMessageRenderer(build_list_embed, 'list')
+
+
+async def update_list_message(channel: discord.TextChannel):
+    # Edit the list message once the current burst of changes has settled
+    list_renderer.request(channel)
 
 
 @bot.command(name="remove_wb")
@@ -343,17 +1097,17 @@ async def remove_countdown_wb(ctx, index: str):
             # Get the message_id of the countdown to be removed
             message_id_to_remove = list(active_countdowns_wb.keys())[index - 1]
 
-            # Remove the countdown from the dictionary
-            del active_countdowns_wb[message_id_to_remove]
+            # Remove the countdown from the dictionary, the scheduler and the journal
+            discard_countdown('wb', message_id_to_remove)
 
             # Update the list message
             await update_list_message_wb(ctx.channel)
 
         else:
-            await ctx.send("Invalid index. Please provide a valid index.")
+            await outbound.send(ctx, "Invalid index. Please provide a valid index.")
     except Exception as e:
         logger.error(f"An error occurred: {str(e)}")
-        await ctx.send("An error occurred while trying to remove the countdown.")
+        await outbound.send(ctx, "An error occurred while trying to remove the countdown.")
 
 
 wb_channel = [1215353681059381326, 1112675424229670995, 1170411419850788936]
@@ -363,21 +1117,9 @@ wb_channel = [1215353681059381326, 1112675424229670995, 1170411419850788936]
 async def wb_countdown(ctx, date_str: str, time_str: str, *, custom_name: str = ""):
     try:
         if ctx.channel.id not in wb_channel:
-            await ctx.send("4. This command is not allowed in this channel.")
+            await outbound.send(ctx, "4. This command is not allowed in this channel.")
             return
 
-        # Load active_countdowns from the JSON file if it hasn't been loaded yet
-        if not active_countdowns_wb:
-            try:
-                with open('wb_countdown.json', 'r') as json_element:
-                    loaded_countdowns_json = json.load(json_element)
-                    # Convert loaded datetime strings to datetime objects
-                    active_countdowns_wb.update(
-                        {the_key: (datetime.datetime.fromisoformat(value[0]), value[1], value[2]) for the_key, value in
-                         loaded_countdowns_json.items()})
-            except (FileNotFoundError, json.JSONDecodeError):
-                print("5. Error loading countdowns from file")
-
         # Parse input date and time
         date_parts = date_str.split('-')
         time_parts = time_str.split(':')
@@ -399,68 +1141,25 @@ async def wb_countdown(ctx, date_str: str, time_str: str, *, custom_name: str =
         countdown_message = f"Countdown will end: {discord_timestamp} ({formatted_time} UTC)"
 
         # Reply to the user's message with the countdown message
-        response_message = await ctx.message.reply(countdown_message)
-
-        # Add "❌" emoji reaction to the response message
-        await response_message.add_reaction("❌")
-
-        def check_reaction(reaction, user):
-            return str(reaction.emoji) == "❌" and reaction.message.id == response_message.id and user == ctx.author
-
-        # Add countdown information to the active_countdowns dictionary with custom name
-        active_countdowns_wb[response_message.id] = (end_time, ctx.author, custom_name)
+        response_message = await outbound.reply(ctx.message, countdown_message, kind='wb_countdown')
 
-        countdown_links_wb[response_message.id] = response_message.jump_url
+        # Add countdown information to the active_countdowns dictionary with custom name, journal it and let the
+        # scheduler wake us at the end time instead of polling every second
+        register_countdown('wb', response_message.id, ctx.channel.id, ctx.author.id, end_time, custom_name,
+                           response_message.jump_url)
 
         # Update the list message and pass the response_message.id
-        await update_list_message_wb(ctx)
-
-        # Wait for the countdown to finish or until the user reacts with "❌" emoji
-        while end_time > datetime.datetime.now(datetime.UTC):
-            await asyncio.sleep(1)
-
-            try:
-                reaction, _ = await bot.wait_for("reaction_add", check=check_reaction, timeout=1)
-                # User reacted with "❌", stop the countdown
-                break
-            except asyncio.TimeoutError:
-                pass
-
-        # Remove the countdown from the dictionary once it expires
-        del active_countdowns_wb[response_message.id]
-
-        # Update the list message
-        await update_list_message_wb(ctx)
-
-        # Edit the original countdown message when the countdown is done
-        await response_message.edit(content="6. Content ended!")
+        await update_list_message_wb(ctx.channel)
 
+    except ValueError:
+        await outbound.send(ctx, "Invalid date or time. Please use the format YYYY-MM-DD HH:MM.")
     except Exception as e:
-        pass
-
-
-async def update_list_message_wb(channel):
-    global list_message_id_wb
-
-    # Check if the list message exists
-    if list_message_id_wb:
-        try:
-            list_message = await channel.fetch_message(list_message_id_wb)
-            await list_message.delete()
-
-        except discord.NotFound:
-            # Log the NotFound error without causing the entire process to fail
-            logger.error("Existing list message not found.")
-
-    # Convert datetime objects to ISO format before saving to JSON
-    serialized_countdowns = {
-        key: (value[0].isoformat(), value[1], value[2]) for key, value in active_countdowns_wb.items()
-    }
+        logger.error(f"Failed to start WB countdown: {e}", exc_info=True)
+        await outbound.send(ctx, "An error occurred while creating the countdown.")
 
-    # Save active_countdowns to a JSON file
-    with open('wb_countdown.json', 'w') as json_file:
-        json.dump(serialized_countdowns, json_file, default=str)
 
+# Function to build the list embed for WB countdowns
+def build_list_embed_wb():
     # Create a new list message with an embedded layout
     embed = discord.Embed(
         title="Active Countdowns",
@@ -484,44 +1183,430 @@ async def update_list_message_wb(channel):
                 inline=False
             )
 
-    # Send the new list message to the same channel
-    list_message = await channel.send(embed=embed)
-    list_message_id_wb = list_message.id
+    return embed
 
 
-# Function to authenticate with Google Sheets using service account credentials
-def authenticate():
-    scope = ['https://www.googleapis.com/auth/spreadsheets']
-    creds = ServiceAccountCredentials.from_json_keyfile_name('byte-417011-9f9c1f58b5fb.json', scope)
-    return gspread.authorize(creds)
+list_renderer_wb = ListMessageRenderer(build_list_embed_wb, 'wb_list')
 
 
-# Function to retrieve logs from the spreadsheet
-def get_logs(username, spreadsheet):
-    try:
+async def update_list_message_wb(channel):
+    # Edit the list message once the current burst of changes has settled
+    list_renderer_wb.request(channel)
+
+
+class SheetsClient:
+    """Long-lived, authorized gspread client with a cache of opened spreadsheets.
+
+    The OAuth token exchange and HTTP session setup happen once; gspread's authorized session refreshes the token
+    by itself when it expires. ``open_by_key`` is the async-safe accessor used by the commands.
+    """
+
+    def __init__(self, keyfile, scope):
+        self._keyfile = keyfile
+        self._scope = scope
+        self._client = None
+        self._spreadsheets = {}
+        self._lock = threading.Lock()
+        self._open_lock = asyncio.Lock()
+
+    def client(self):
+        # Blocking; call it from an executor thread
+        with self._lock:
+            if self._client is None:
+                creds = ServiceAccountCredentials.from_json_keyfile_name(self._keyfile, self._scope)
+                self._client = gspread.authorize(creds)
+            return self._client
+
+    def _open(self, spreadsheet_key):
+        client = self.client()
+        if spreadsheet_key not in self._spreadsheets:
+            self._spreadsheets[spreadsheet_key] = client.open_by_key(spreadsheet_key)
+        return self._spreadsheets[spreadsheet_key]
+
+    async def open_by_key(self, spreadsheet_key):
+        if spreadsheet_key in self._spreadsheets:
+            return self._spreadsheets[spreadsheet_key]
+        async with self._open_lock:
+            with metrics.timer('http_request_duration_seconds', target='sheets'):
+                return await network_pool.run(self._open, spreadsheet_key)
+
+
+# Shared Google Sheets client using the service account credentials
+sheets_client = SheetsClient('byte-417011-9f9c1f58b5fb.json', ['https://www.googleapis.com/auth/spreadsheets'])
+
+
+class Leaderboard:
+    """Running totals kept in descending order, so top-N, page and rank queries never sort.
+
+    Each update moves one entry with two bisections; a rank lookup is a dictionary hit plus one bisection.
+    """
+
+    def __init__(self):
+        self.totals = {}
+        self._names = {}  # casefolded name -> name
+        self._order = []  # (-total, name), ascending
+
+    def __len__(self):
+        return len(self._order)
+
+    def update(self, deltas):
+        for name, amount in deltas.items():
+            old_total = self.totals.get(name)
+            if old_total is not None:
+                del self._order[bisect.bisect_left(self._order, (-old_total, name))]
+            else:
+                self._names.setdefault(name.casefold(), name)
+            self.totals[name] = (old_total or 0) + amount
+            bisect.insort(self._order, (-self.totals[name], name))
+
+    def top(self, count=None, offset=0):
+        """Return ``(rank, name, total)`` for ``count`` entries starting ``offset`` places from the top."""
+        end = len(self._order) if count is None else offset + count
+        return [(rank, name, -negative_total)
+                for rank, (negative_total, name) in enumerate(self._order[offset:end], start=offset + 1)]
+
+    def rank(self, name):
+        """Return ``(rank, name, total)`` for a name, matched case-insensitively, or None."""
+        name = name if name in self.totals else self._names.get(name.casefold())
+        if name is None:
+            return None
+        total = self.totals[name]
+        return bisect.bisect_left(self._order, (-total, name)) + 1, name, total
+
+
+class PlayerIndex:
+    """Loot-log rows by case-folded player name, with per-(item, enchantment) totals kept alongside.
+
+    Names are also kept in a sorted list, so prefix matches are a bisection; anything else falls back to difflib's
+    close matches. Rows are added as the sheet grows, so a lookup never depends on the size of the sheet.
+    """
+
+    def __init__(self):
+        self._rows = {}  # casefolded name -> [[item, enchantment, amount], ...]
+        self._totals = {}  # casefolded name -> Counter of (item, enchantment) -> amount
+        self._names = {}  # casefolded name -> name as first seen
+        self._sorted = []  # casefolded names
+
+    def __len__(self):
+        return len(self._names)
+
+    def canonical(self, name):
+        """Return the spelling ``name`` was first seen with, registering it if it is new."""
+        key = name.casefold()
+        if key not in self._names:
+            self._names[key] = name
+            self._rows[key] = []
+            self._totals[key] = collections.Counter()
+            bisect.insort(self._sorted, key)
+        return self._names[key]
+
+    def add(self, name, item, enchantment, amount):
+        key = self.canonical(name).casefold()
+        self._rows[key].append([item, enchantment, str(amount)])
+        self._totals[key][item, enchantment] += amount
+
+    def resolve(self, query, limit=5):
+        """Return ``(name, candidates)``: the one player ``query`` refers to, or None and the closest names."""
+        key = query.casefold()
+        if key in self._names:
+            return self._names[key], []
+
+        start = bisect.bisect_left(self._sorted, key)
+        prefixed = list(itertools.islice(itertools.takewhile(lambda name: name.startswith(key),
+                                                             self._sorted[start:start + limit + 1]), limit + 1))
+        if len(prefixed) == 1:
+            return self._names[prefixed[0]], []
+        if not prefixed:
+            prefixed = difflib.get_close_matches(key, self._sorted, n=limit, cutoff=0.75)
+        return None, [self._names[name] for name in prefixed[:limit]]
+
+    def rows(self, name):
+        return self._rows.get(name.casefold(), [])
+
+    def totals(self, name):
+        return self._totals.get(name.casefold(), collections.Counter())
+
+
+class SheetsLootLogSource:
+    """Reads loot-log rows from the first worksheet of a Google spreadsheet."""
+
+    def __init__(self, spreadsheet_key):
+        self.name = spreadsheet_key
+
+    async def fetch_rows(self, start):
+        """Return the rows from ``start`` (0-based, header included) to the end of the sheet."""
+        spreadsheet = await sheets_client.open_by_key(self.name)
+        with metrics.timer('http_request_duration_seconds', target='sheets'):
+            return await network_pool.run(self._fetch_rows, spreadsheet, start)
+
+    @staticmethod
+    def _fetch_rows(spreadsheet, start):
         sheet = spreadsheet.sheet1
-        all_values = sheet.get_all_values()
-        user_logs = []
-        for row in all_values[1:]:
-            if len(row) >= 6:  # Ensure row has at least 6 columns
-                if row[1] == username and int(
-                        row[5]) > 0:  # Check if the Player matches the username and amount is positive
-                    # Append a list of (Item, Enchantment, Amount) to the user_logs list
-                    user_logs.append([row[2], row[3], row[5]])
+        if start == 0:
+            return sheet.get_all_values()
+        # A1 rows are 1-based, so this is the first row we haven't seen yet
+        return sheet.get(f"A{start + 1}:G")
+
+
+class CsvLootLogSource:
+    """Stand-in for the spreadsheet that reads the same columns from a local CSV file, for tests and benchmarks."""
+
+    def __init__(self, path):
+        self.name = path
+
+    async def fetch_rows(self, start):
+        return await disk_pool.run(self._fetch_rows, start)
+
+    def _fetch_rows(self, start):
+        with open(self.name, 'r', encoding='utf-8-sig', newline='') as csv_file:
+            return list(itertools.islice(csv.reader(csv_file), start, None))
+
+
+class LootLogSnapshot:
+    """Local SQLite copy of loot-log rows, one column per sheet column, so the cache can start without the sheet.
+
+    Every source's rows are stored by row number along with how far the source has been synced and when it was last
+    reloaded in full. The connection is only used from the disk pool's single thread, which also keeps writes in
+    order with the countdown journals.
+    """
+
+    columns = ('logged_at', 'player', 'item', 'enchantment', 'quality', 'amount', 'guild')
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript(f"""
+                PRAGMA journal_mode = WAL;
+                CREATE TABLE IF NOT EXISTS loot_rows (
+                    source TEXT NOT NULL,
+                    row_number INTEGER NOT NULL,
+                    {', '.join(f'{column} TEXT' for column in self.columns)},
+                    PRIMARY KEY (source, row_number)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS loot_sync (
+                    source TEXT PRIMARY KEY,
+                    synced_rows INTEGER NOT NULL,
+                    full_synced_at REAL NOT NULL
+                );
+            """)
+        return self._conn
+
+    def load(self, source):
+        """Return ``(rows, full_synced_at)`` for a source, or None when it has never been synced."""
+        conn = self._connection()
+        sync = conn.execute("SELECT synced_rows, full_synced_at FROM loot_sync WHERE source = ?", (source,)).fetchone()
+        if sync is None:
+            return None
+        rows = []
+        query = f"SELECT row_number, {', '.join(self.columns)} FROM loot_rows WHERE source = ? ORDER BY row_number"
+        for row_number, *cells in conn.execute(query, (source,)):
+            # Row numbers are kept even for blank rows, so a gap means the snapshot is damaged
+            if row_number != len(rows):
+                logger.error(f"Loot-log snapshot for {source} is missing row {len(rows)}, reloading it")
+                return None
+            while cells and cells[-1] is None:
+                cells.pop()
+            rows.append(cells)
+        if len(rows) != sync[0]:
+            return None
+        return rows, sync[1]
+
+    def save(self, source, start, rows, full_synced_at):
+        """Store rows fetched from ``start``; a fetch from row 0 replaces everything stored for the source."""
+        width = len(self.columns)
+        conn = self._connection()
+        try:
+            with conn:
+                if start == 0:
+                    conn.execute("DELETE FROM loot_rows WHERE source = ?", (source,))
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO loot_rows (source, row_number, {', '.join(self.columns)}) "
+                    f"VALUES (?, ?, {', '.join('?' * width)})",
+                    ((source, start + offset, *row[:width], *[None] * (width - len(row[:width])))
+                     for offset, row in enumerate(rows)))
+                conn.execute("INSERT OR REPLACE INTO loot_sync (source, synced_rows, full_synced_at) VALUES (?, ?, ?)",
+                             (source, start + len(rows), full_synced_at))
+        except sqlite3.Error as e:
+            logger.error(f"Failed to update the loot-log snapshot {self.path}: {e}")
+
+
+class LootLogCache:
+    """In-process copy of a loot-log sheet with per-player rows and player / guild leaderboards.
+
+    The first read loads the local snapshot when there is one, and the whole sheet otherwise. After that, reads are
+    answered from memory; once the data is older than ``ttl`` seconds a background refresh fetches only the rows
+    appended since the last sync. A full reload every ``full_sync_interval`` seconds picks up rows that were edited
+    or removed in place. Every fetch is written to the snapshot.
+    """
+
+    def __init__(self, source, snapshot=None, ttl=60, full_sync_interval=3600):
+        self.source = source
+        self.snapshot = snapshot
+        self.ttl = ttl
+        self.full_sync_interval = full_sync_interval
+        self._lock = asyncio.Lock()
+        self._refresh_task = None
+        self._synced_at = None
+        self._full_synced_at = None
+        self._full_synced_wall = None  # time.time() of the last full reload, kept in the snapshot
+        self._reset()
+
+    def _reset(self):
+        self.synced_rows = 0  # sheet rows processed so far, header included
+        self.player_index = PlayerIndex()
+        self.players = Leaderboard()
+        self.guilds = Leaderboard()
+
+    async def get(self):
+        """Return the cache, loading it on first use and refreshing it in the background when stale."""
+        metrics.increment('cache_requests_total', cache='loot_log', result='miss' if self._synced_at is None else 'hit')
+        if self._synced_at is None:
+            if await self._restore():
+                # Serve the snapshot right away and catch up with the sheet behind it
+                if not self._refreshing():
+                    self._refresh_task = asyncio.get_running_loop().create_task(self._refresh_in_background())
             else:
-                logging.error(f"9. Ignoring row with insufficient columns: {row}")
-        return user_logs
-    except Exception as e:
-        logging.error(f"10. Error retrieving logs: {e}")
-        return None
+                await self.refresh()
+        elif time.monotonic() - self._synced_at > self.ttl and not self._refreshing():
+            self._refresh_task = asyncio.get_running_loop().create_task(self._refresh_in_background())
+        return self
+
+    async def _restore(self):
+        if self.snapshot is None:
+            return False
+        async with self._lock:
+            if self._synced_at is not None:
+                return True
+            try:
+                restored = await disk_pool.run(self.snapshot.load, self.source.name)
+            except sqlite3.Error as e:
+                logger.error(f"Failed to read the loot-log snapshot: {e}")
+                return False
+            if restored is None:
+                return False
+            rows, self._full_synced_wall = restored
+            self._reset()
+            self._apply(rows)
+            self._full_synced_at = time.monotonic() - max(0.0, time.time() - self._full_synced_wall)
+            self._synced_at = time.monotonic()
+            return True
+
+    def _refreshing(self):
+        return self._refresh_task is not None and not self._refresh_task.done()
+
+    async def _refresh_in_background(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.error(f"Failed to refresh the loot log cache: {e}")
+
+    async def refresh(self):
+        async with self._lock:
+            full = self._full_synced_at is None or time.monotonic() - self._full_synced_at > self.full_sync_interval
+            start = 0 if full else self.synced_rows
+            rows = await self.source.fetch_rows(start)
+            if full:
+                self._reset()
+                self._full_synced_at = time.monotonic()
+                self._full_synced_wall = time.time()
+            self._apply(rows)
+            self._synced_at = time.monotonic()
+            if self.snapshot is not None and (full or rows):
+                await disk_pool.run(self.snapshot.save, self.source.name, start, rows, self._full_synced_wall)
+
+    def _apply(self, rows):
+        first_row = self.synced_rows
+        self.synced_rows += len(rows)
+        player_deltas = collections.Counter()
+        guild_deltas = collections.Counter()
+        for offset, row in enumerate(rows):
+            if first_row + offset == 0:
+                continue  # Header row
+            if len(row) < 6:
+                if row:
+                    logger.error(f"9. Ignoring row with insufficient columns: {row}")
+                continue
+            amount = parse_quantity(row[5])
+            if amount is None:
+                logger.error(f"9. Ignoring row with a non-numeric amount: {row}")
+                continue
+
+            if amount < 0:
+                continue  # Withdrawals count neither towards `log` nor towards the totals
+            player_name = row[1]
+            player_guild = row[6] if len(row) > 6 else ""
+
+            if amount > 0:
+                # (Item, Enchantment, Amount) as shown by `log`
+                self.player_index.add(player_name, row[2], row[3], amount)
+            player_deltas[player_name] += amount
+            if player_guild:
+                guild_deltas[player_guild] += amount
+
+        # Each leaderboard entry moves once per batch of new rows
+        self.players.update(player_deltas)
+        self.guilds.update(guild_deltas)
+
+
+loot_log_caches = {}
+# A CSV file with the sheet's columns can stand in for the spreadsheet, e.g. for tests and benchmarks
+loot_log_source = os.getenv('LOOT_LOG_SOURCE')
+loot_log_snapshot_path = os.getenv('LOOT_LOG_SNAPSHOT', 'loot_log.sqlite3')
+loot_log_snapshot = LootLogSnapshot(loot_log_snapshot_path) if loot_log_snapshot_path else None
+
+
+# Function to get the shared cache for a loot-log spreadsheet
+async def get_loot_log(spreadsheet_key):
+    if spreadsheet_key not in loot_log_caches:
+        source = CsvLootLogSource(loot_log_source) if loot_log_source else SheetsLootLogSource(spreadsheet_key)
+        loot_log_caches[spreadsheet_key] = LootLogCache(source, loot_log_snapshot)
+    return await loot_log_caches[spreadsheet_key].get()
+
+
+# Function to retrieve logs for a player from the cached loot log
+def get_logs(username, loot_log):
+    # Return a copy so callers can add their own rows
+    return [list(row) for row in loot_log.player_index.rows(username)]
+
+
+# Function to retrieve a player's totals per (item, enchantment) from the cached loot log
+def get_log_totals(username, loot_log):
+    return [[item, enchantment, str(amount)]
+            for (item, enchantment), amount in loot_log.player_index.totals(username).most_common()]
+
+
+# Logs longer than this many pages are sent as a file
+log_max_pages = int(os.getenv('LOG_MAX_PAGES', '10'))
+
+
+# Function to write loot-log rows as CSV for the `log` attachment
+def write_log_csv(rows, headers):
+    stream = io.StringIO()
+    writer = csv.writer(stream)
+    writer.writerow(headers)
+    writer.writerows(rows)
+    return stream.getvalue().encode('utf-8-sig')
 
 
 # Discord command to retrieve logs for a specific player
 @bot.command()
-async def log(ctx, Player):
+async def log(ctx, Player, mode: str = ""):
     try:
-        spreadsheet = authenticate().open_by_key('1ZKroN93892iTp8WfgcHT75uIFDflsJGvtafN8MSj6i8')
-        user_logs = get_logs(Player, spreadsheet)
+        loot_log = await get_loot_log(user_logger)
+        # Names match case-insensitively, and a unique prefix is enough
+        name, candidates = loot_log.player_index.resolve(Player)
+        if name is None:
+            suggestion = f" Did you mean: {', '.join(candidates)}?" if candidates else ""
+            await outbound.send(ctx, f"12. No logs found for the user.{suggestion}")
+            return
+        Player = name
+
+        # `items` sums the amounts per item and enchantment instead of listing every entry
+        user_logs = get_log_totals(Player, loot_log) if mode.lower() == 'items' else get_logs(Player, loot_log)
         if user_logs:
             # Calculate total amount
             total_amount = sum(int(row[2]) for row in user_logs)
@@ -530,20 +1615,21 @@ async def log(ctx, Player):
             headers = ["Item", "Enchantment", "Amount"]
             user_logs.insert(0, ["Total amount", "", f"**{total_amount}**"])  # Use Markdown bold for total amount
 
-            # Format table
-            table = tabulate.tabulate(user_logs, headers=headers, tablefmt="fancy_grid")
-            chunks = split_message_chunks(table)
-
-            # Send message in chunks
-            for chunk in chunks:
-                # Use Discord Markdown to color the total amount blue
-                formatted_chunk = chunk.replace(f"**{total_amount}**",
-                                                f"**{total_amount}**")  # Replace total amount with blue colored text
-                await ctx.send(f"```{formatted_chunk}```")
+            # Page boundaries are measured from the rendered rows, which is what decides how the table is sent
+            paginator = await cpu_pool.run(TablePaginator, user_logs, headers)
+            if paginator.page_count <= log_max_pages:
+                # One message, or one message with page buttons
+                await paginations.start(ctx, paginator)
+            else:
+                # Too long to page through, so send the rows as a single CSV attachment
+                data = await cpu_pool.run(write_log_csv, user_logs[1:], headers)
+                await outbound.send(ctx, f"**{Player}** has {len(user_logs) - 1} log entries, total amount "
+                                         f"{format_number(total_amount)}.",
+                                    file=discord.File(io.BytesIO(data), filename=f"{Player}_log.csv"))
         else:
-            await ctx.send("12. No logs found for the user.")
+            await outbound.send(ctx, "12. No logs found for the user.")
     except Exception as e:
-        await ctx.send(f"13. An error occurred: {e}")
+        await outbound.send(ctx, f"13. An error occurred: {e}")
 
 
 # Function to check if a user has a specific role
@@ -556,130 +1642,632 @@ def check_role(user):
         lowercase_roles)
 
 
+# Guilds whose loot is reconciled by `loot_logger`
+loot_guilds = {"smurfing monkeys", "surfing penguins"}
+
+
+class LootLedger:
+    """Looted and deposited quantities per (user, item), stored column-wise.
+
+    User and item names are interned to small integers and every (user, item) pair owns one slot in a set of
+    ``array`` columns, so hundreds of thousands of CSV rows fold into a few compact arrays.
+    """
+
+    def __init__(self):
+        self.users = []
+        self.items = []
+        self._user_ids = {}
+        self._item_ids = {}
+        self._slots = {}
+        self.pair_user = array.array('l')
+        self.pair_item = array.array('l')
+        self.looted = array.array('q')
+        self.deposited = array.array('q')
+
+    def _intern(self, names, ids, name):
+        name_id = ids.get(name)
+        if name_id is None:
+            name_id = ids[name] = len(names)
+            names.append(name)
+        return name_id
+
+    def _slot(self, user, item):
+        user_id = self._intern(self.users, self._user_ids, user)
+        item_id = self._intern(self.items, self._item_ids, item)
+        key = (user_id << 32) | item_id
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = len(self.looted)
+            self.pair_user.append(user_id)
+            self.pair_item.append(item_id)
+            self.looted.append(0)
+            self.deposited.append(0)
+        return slot
+
+    def add_loot(self, user, item, quantity):
+        self.looted[self._slot(user, item)] += quantity
+
+    def add_deposit(self, user, item, quantity):
+        self.deposited[self._slot(user, item)] += quantity
+
+    def merge(self, other):
+        for slot in range(len(other.looted)):
+            user, item = other.users[other.pair_user[slot]], other.items[other.pair_item[slot]]
+            target = self._slot(user, item)
+            self.looted[target] += other.looted[slot]
+            self.deposited[target] += other.deposited[slot]
+        return self
+
+    def undeposited(self):
+        """Return ``{user: [(item, missing quantity), ...]}`` for loot that never reached the chest."""
+        missing = {}
+        for slot in range(len(self.looted)):
+            quantity = self.looted[slot] - self.deposited[slot]
+            if quantity > 0:
+                missing.setdefault(self.users[self.pair_user[slot]], []).append(
+                    (self.items[self.pair_item[slot]], quantity))
+        return missing
+
+
+def parse_quantity(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+# Function to stream one loot-log or chest-log CSV export into a ledger
+def read_loot_csv(data, ledger=None):
+    ledger = LootLedger() if ledger is None else ledger
+    stream = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8-sig', errors='replace', newline='')
+    header_line = stream.readline()
+    delimiter = max(';', '\t', ',', key=header_line.count)
+    header = [column.strip().strip('"').lower() for column in next(csv.reader([header_line], delimiter=delimiter))]
+    reader = csv.reader(stream, delimiter=delimiter)
+
+    if 'player' in header and 'amount' in header:
+        # Chest log: "Date", "Player", "Item", "Enchantment", "Quality", "Amount"
+        player, item, amount = header.index('player'), header.index('item'), header.index('amount')
+        width = max(player, item, amount)
+        for row in reader:
+            if len(row) > width:
+                quantity = parse_quantity(row[amount])
+                if quantity is not None:
+                    ledger.add_deposit(row[player], row[item], quantity)
+    else:
+        # Loot log: timestamp_utc;looted_by__alliance;looted_by__guild;looted_by__name;item_id;item_name;quantity;...
+        columns = {name: index for index, name in enumerate(header)}
+        guild = columns.get('looted_by__guild', 2)
+        user = columns.get('looted_by__name', 3)
+        item = columns.get('item_name', 5)
+        amount = columns.get('quantity', 6)
+        width = max(guild, user, item, amount)
+        for row in reader:
+            if len(row) > width and row[guild].lower() in loot_guilds:
+                quantity = parse_quantity(row[amount])
+                if quantity is not None:
+                    ledger.add_loot(row[user], row[item], quantity)
+    return ledger
+
+
+# Function to merge the per-file ledgers and list what was never deposited
+def reconcile_loot_ledgers(ledgers):
+    ledger = LootLedger()
+    for other in ledgers:
+        ledger.merge(other)
+    return ledger.undeposited()
+
+
+# Function to parse every export on the CPU pool and merge the results
+async def reconcile_loot_files(file_contents):
+    ledgers = await asyncio.gather(*(cpu_pool.run(read_loot_csv, data) for data in file_contents))
+    return await cpu_pool.run(reconcile_loot_ledgers, ledgers)
+
+
 @bot.command(name='loot_logger')
 async def loot_logger(ctx):
     # Check if the user has one of the required roles
     if not check_role(ctx.author):
-        await ctx.send("14. You do not have permission to use this command.")
+        await outbound.send(ctx, "14. You do not have permission to use this command.")
         return
 
     if ctx.channel.id not in allowed_channel_ids:
-        await ctx.send("15. This command is not allowed in this channel.")
+        await outbound.send(ctx, "15. This command is not allowed in this channel.")
         return
 
-    from tabulate import tabulate
     try:
         attachments = ctx.message.attachments
         if not attachments or not all(attachment.filename.endswith('.csv') for attachment in attachments):
-            await ctx.send("16. Please attach one or more CSV files.")
+            await outbound.send(ctx, "16. Please attach one or more CSV files.")
             return
 
-        summary_tables = []
+        # Download every attachment at once, then parse and reconcile them off the event loop
+        file_contents = await asyncio.gather(*(attachment.read() for attachment in attachments))
+        undeposited_items = await reconcile_loot_files(file_contents)
 
-        for attachment in attachments:
-            file_content = await attachment.read()
+        summary_table = []
+        for player_count, (user, items) in enumerate(sorted(undeposited_items.items()), start=1):
+            undeposited_items_str = "\n".join([f"{item} ( {quantity} )" for item, quantity in items])
+            summary_table.append((f"({player_count}) - [ {user} ]", len(items), undeposited_items_str))
 
-            csv_data = StringIO(file_content.decode())
-            reader = csv.reader(csv_data, delimiter=';')
-            deposit_data = list(reader)
+        headers = ["User", "Undepo\nItems\nCount", "Undepo Items Names \n+count for each item \n( number )"]
+        paginator = await cpu_pool.run(TablePaginator, summary_table, headers)
 
-            deposited_items = {}
-            for row in deposit_data[1:]:
-                guild = row[2]
-                if guild.lower() not in ["smurfing monkeys", "surfing penguins"]:
-                    continue
+        # Page through the table with ⬅️/➡️; the registry handles the reactions
+        await paginations.start(ctx, paginator)
 
-                user = row[3]
-                item = row[5]
-                quantity = row[6]
-                if user not in deposited_items:
-                    deposited_items[user] = {(item, quantity)}
-                else:
-                    deposited_items[user].add((item, quantity))
+    except Exception as e:
+        await outbound.send(ctx, f"18. An error occurred: {e}")
 
-            user_logs = {(row[3], row[5]) for row in deposit_data[1:]}
 
-            undeposited_items = {}
-            for user, items in deposited_items.items():
-                undeposited_items[user] = items - user_logs
+class TablePaginator:
+    """Keeps the rows of a table and renders only the page being shown.
 
-            summary_table = []
-            player_count = 1
-            for user, items in undeposited_items.items():
-                if items:
-                    undeposited_items_str = "\n".join([f"{item[0]} ( {item[1]} )" for item in items])
-                    summary_table.append((f"({player_count}) - [ {user} ]", len(items), undeposited_items_str))
-                    player_count += 1
+    Page boundaries are computed up front from the width and height of each row, so a page never splits a row and
+    every page repeats the headers. Rendered pages are kept in a small LRU cache.
+    """
 
-            summary_tables.append(summary_table)
+    def __init__(self, rows, headers, tablefmt="fancy_grid", max_chars=1900, cache_size=8):
+        self.rows = rows
+        self.headers = headers
+        self.tablefmt = tablefmt
+        self.max_chars = max_chars
+        self._cache_size = cache_size
+        self._cache = collections.OrderedDict()
+        self._pages = self._paginate()
+
+    @property
+    def page_count(self):
+        return len(self._pages)
+
+    @staticmethod
+    def _cell_size(cell):
+        lines = str(cell).split('\n')
+        return max(len(line) for line in lines), len(lines)
+
+    @staticmethod
+    def _number_parts(cell):
+        """Digits before and after the decimal point, as written and as tabulate's "g" format writes it."""
+        text = str(cell).strip()
+        try:
+            value = float(text)
+        except ValueError:
+            return None
+        if not math.isfinite(value):
+            return None
+        integer = fraction = 0
+        for form in (text, format(value, 'g')):
+            head, _, tail = form.partition('.')
+            integer = max(integer, len(head))
+            fraction = max(fraction, len(tail))
+        return integer, fraction
+
+    def _paginate(self):
+        # tabulate pads every column to at least its header plus two spaces
+        widths = [self._cell_size(header)[0] + 2 for header in self.headers]
+        integers = [0] * len(self.headers)
+        fractions = [0] * len(self.headers)
+        heights = []
+        for row in self.rows:
+            height = 1
+            for column, cell in enumerate(row):
+                width, lines = self._cell_size(cell)
+                widths[column] = max(widths[column], width)
+                height = max(height, lines)
+                parts = self._number_parts(cell)
+                if parts is not None:
+                    integers[column] = max(integers[column], parts[0])
+                    fractions[column] = max(fractions[column], parts[1])
+            heights.append(height)
+
+        # Numbers are aligned on the decimal point, which can make a column wider than its widest cell; with the
+        # widths above this bounds the width of every page
+        for column, integer in enumerate(integers):
+            widths[column] = max(widths[column], integer + (fractions[column] + 1 if fractions[column] else 0))
+
+        # "│ a │ b │" plus the newline; every row is followed by a separator line
+        line_width = sum(widths) + 3 * len(widths) + 2
+        header_height = max(self._cell_size(header)[1] for header in self.headers)
+        budget = self.max_chars - (header_height + 3) * line_width
+
+        pages = []
+        start = 0
+        used = 0
+        for index, height in enumerate(heights):
+            cost = (height + 1) * line_width
+            if index > start and used + cost > budget:
+                pages.append((start, index))
+                start = index
+                used = 0
+            used += cost
+        pages.append((start, len(self.rows)))
+        return pages
+
+    def render_page(self, page):
+        if page in self._cache:
+            metrics.increment('cache_requests_total', cache='table_page', result='hit')
+            self._cache.move_to_end(page)
+            return self._cache[page]
+        metrics.increment('cache_requests_total', cache='table_page', result='miss')
+
+        start, end = self._pages[page]
+        table = tabulate.tabulate(self.rows[start:end], headers=self.headers, tablefmt=self.tablefmt)
+        if len(table) > self.max_chars:
+            # Only a single row taller than a whole message gets here
+            table = table[:self.max_chars - 2] + "\n…"
+
+        self._cache[page] = table
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return table
+
+    def page_text(self, page):
+        return f"```Page {page + 1}/{self.page_count}\n{self.render_page(page)}```"
+
+
+class PaginationSession:
+    def __init__(self, message, paginator, owner_id, page=0):
+        self.message = message
+        self.paginator = paginator
+        self.owner_id = owner_id
+        self.page = page
+        self.last_used = time.monotonic()
+
+
+class PaginationRegistry:
+    """Page state for every paginated message, keyed by message ID and driven from `on_reaction_add`.
+
+    Sessions are dropped after ``idle_timeout`` seconds without a page change, and the least recently used session is
+    dropped once ``max_sessions`` are open, so nothing accumulates however often the commands run.
+    """
 
-        formatted_tables = []
-        headers = ["User", "Undepo\nItems\nCount", "Undepo Items Names \n+count for each item \n( number )"]
-        for summary_table in summary_tables:
-            table_str = tabulate(summary_table, headers=headers, tablefmt="fancy_grid")
-            formatted_tables.append(table_str)
+    buttons = ('⬅️', '➡️')
 
-        combined_table_str = "\n".join(formatted_tables)
-        message_chunks = paginate_output(combined_table_str)
+    def __init__(self, idle_timeout=900, max_sessions=50):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self._sessions = collections.OrderedDict()
 
-        current_page = 0
-        message = await ctx.send(f"```Page {current_page + 1}/{len(message_chunks)}\n{message_chunks[current_page]}```")
+    def __len__(self):
+        return len(self._sessions)
 
-        await message.add_reaction('⬅️')
-        await message.add_reaction('➡️')
+    def _expire(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.last_used > cutoff and len(self._sessions) <= self.max_sessions:
+                break
+            self._sessions.popitem(last=False)
+
+    async def start(self, ctx, paginator, page=0):
+        """Send a page and, when there is more than one, wire up the ⬅️/➡️ buttons."""
+        page = max(0, min(page, paginator.page_count - 1))
+        # A table that fits on one page is an ordinary reply
+        message = await outbound.send(ctx, paginator.page_text(page),
+                                      kind='page' if paginator.page_count > 1 else 'reply')
+        if paginator.page_count > 1:
+            self._sessions[message.id] = PaginationSession(message, paginator, ctx.author.id, page)
+            self._expire()
+            for emoji in self.buttons:
+                await outbound.add_reaction(message, emoji)
+        return message
+
+    def discard(self, message_id):
+        self._sessions.pop(message_id, None)
+
+    async def handle_reaction(self, reaction, user):
+        """Turn the page for a ⬅️/➡️ reaction; returns False when the reaction isn't a page button."""
+        emoji = str(reaction.emoji)
+        if emoji not in self.buttons:
+            return False
+        self._expire()
+        session = self._sessions.get(reaction.message.id)
+        if session is None:
+            return False
+        if user.id != session.owner_id:
+            return True
+
+        session.last_used = time.monotonic()
+        self._sessions.move_to_end(reaction.message.id)
+        if emoji == '⬅️':
+            page = max(0, session.page - 1)
+        else:
+            page = min(session.paginator.page_count - 1, session.page + 1)
 
-        while True:
-            try:
-                reaction, user = await bot.wait_for('reaction_add',
-                                                    check=lambda r, u: u == ctx.author and str(r.emoji) in ['⬅️', '➡️',
-                                                                                                            '🛂', '🔄'])
+        if page != session.page:
+            session.page = page
+            await outbound.edit(session.message, content=session.paginator.page_text(page))
+        await outbound.remove_reaction(reaction, user)
+        return True
 
-                if str(reaction.emoji) == '⬅️':
-                    current_page = max(0, current_page - 1)
-                elif str(reaction.emoji) == '➡️':
-                    current_page = min(len(message_chunks) - 1, current_page + 1)
 
-                await message.edit(
-                    content=f"```Page {current_page + 1}/{len(message_chunks)}\n{message_chunks[current_page]}```")
-                await reaction.remove(user)
+paginations = PaginationRegistry()
 
-            except Exception as e:
-                await ctx.send(f"17. An error occurred: {e}")
 
-    except Exception as e:
-        await ctx.send(f"18. An error occurred: {e}")
+class DatabaseUnavailable(Exception):
+    pass
 
 
-def paginate_output(text: str, max_chars: int = 1950) -> List[str]:
-    """Paginate the given text."""
-    if len(text) <= max_chars:
-        return [text]
-    chunks = []
-    current_chunk = ""
-    for line in text.split('\n'):
-        if len(current_chunk) + len(line) + 1 > max_chars:
-            chunks.append(current_chunk)
-            current_chunk = ""
-        current_chunk += line + '\n'
-    if current_chunk:
-        chunks.append(current_chunk)
-    return chunks
+statement_table_pattern = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE)\s+(?:IF NOT EXISTS\s+)?`?(\w+)', re.IGNORECASE)
 
 
-# Function to establish MySQL connection for DATABASE2
-def establish_connection_2():
-    try:
-        conn = mysql.connector.connect(
-            host=os.getenv('HOST'),
-            user=os.getenv('USER'),
-            password=os.getenv('PASSWORD'),
-            database=os.getenv('DATABASE2'),  # Select DATABASE2
-            auth_plugin='mysql_native_password',
-        )
+# Function to label a statement for the DB metrics by its kind and first table, e.g. "select users"
+def statement_label(query):
+    words = query.split(None, 1)
+    kind = words[0].lower() if words else 'unknown'
+    match = statement_table_pattern.search(query)
+    return f"{kind} {match.group(1)}" if match else kind
+
+
+class DatabaseConnection:
+    """A pooled MySQL connection whose queries run on the database executor."""
+
+    def __init__(self, database, conn):
+        self._database = database
+        self._conn = conn
+
+    def _query(self, query, params, fetch):
+        cursor = self._conn.cursor()
+        try:
+            cursor.execute(query, params)
+            if fetch == 'one':
+                return cursor.fetchone()
+            if fetch == 'all':
+                return cursor.fetchall()
+            if fetch == 'lastrowid':
+                return cursor.lastrowid
+            return cursor.rowcount
+        finally:
+            cursor.close()
+
+    def _query_many(self, query, seq_params):
+        cursor = self._conn.cursor()
+        try:
+            cursor.executemany(query, seq_params)
+            return cursor.rowcount
+        finally:
+            cursor.close()
+
+    async def fetchone(self, query, params=()):
+        return await self._database.run(self._query, query, params, 'one', op=statement_label(query))
+
+    async def fetchall(self, query, params=()):
+        return await self._database.run(self._query, query, params, 'all', op=statement_label(query))
+
+    async def execute(self, query, params=()):
+        return await self._database.run(self._query, query, params, None, op=statement_label(query))
+
+    async def insert(self, query, params=()):
+        """Run an INSERT and return the generated row id."""
+        return await self._database.run(self._query, query, params, 'lastrowid', op=statement_label(query))
+
+    async def executemany(self, query, seq_params):
+        return await self._database.run(self._query_many, query, list(seq_params), op=statement_label(query))
+
+    async def commit(self):
+        await self._database.run(self._conn.commit)
+
+    async def rollback(self):
+        await self._database.run(self._conn.rollback)
+
+
+class Database:
+    """Bounded pool of MySQL connections for DATABASE2.
+
+    Connections are checked out with ``async with database.connection() as db`` and health-checked with a ping
+    on checkout. Connecting and querying happen on a blocking pool of the same size, so a slow handshake or query
+    never stalls the event loop.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._semaphore = asyncio.Semaphore(size)
+        self.threads = BlockingPool('mysql', size)
+
+    async def run(self, func, *args, op=None):
+        with metrics.timer('db_call_duration_seconds', op=op or func.__name__):
+            return await self.threads.run(func, *args)
+
+    def _connect(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = mysql.connector.pooling.MySQLConnectionPool(
+                    pool_name='byte_emily',
+                    pool_size=self.size,
+                    host=os.getenv('HOST'),
+                    user=os.getenv('USER'),
+                    password=os.getenv('PASSWORD'),
+                    database=os.getenv('DATABASE2'),  # Select DATABASE2
+                    auth_plugin='mysql_native_password',
+                )
+        conn = self._pool.get_connection()
+        try:
+            # Replace connections the server has dropped while they sat in the pool
+            conn.ping(reconnect=True, attempts=2, delay=0)
+        except mysql.connector.Error:
+            conn.close()
+            raise
         return conn
-    except mysql.connector.Error as err:
-        logger.error("Failed to establish MySQL connection:", exc_info=True)
-        return None
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        async with self._semaphore:
+            try:
+                conn = await self.run(self._connect)
+            except mysql.connector.Error as err:
+                logger.error("Failed to establish MySQL connection:", exc_info=True)
+                raise DatabaseUnavailable(str(err)) from err
+            try:
+                yield DatabaseConnection(self, conn)
+            except BaseException:
+                await self.run(conn.rollback)
+                raise
+            finally:
+                # Closing a pooled connection hands it back to the pool
+                await self.run(conn.close)
+
+
+database = Database(int(os.getenv('DB_POOL_SIZE', '5')))
+
+
+class UserDirectory:
+    """In-process index of the users table by username, IGN username and Discord user id.
+
+    It is loaded at startup, updated in place by `signup` and `delete_user`, and reconciled with the database
+    every ``USER_DIRECTORY_RECONCILE_SECONDS`` seconds (0 turns that off).
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._ids_by_name = {}
+        self._users_by_discord_id = {}
+
+    def load(self, rows):
+        self._ids_by_name = {}
+        self._users_by_discord_id = {}
+        for user_id, discord_user_id, username, ign_username in rows:
+            self.add(user_id, discord_user_id, username, ign_username)
+        self.loaded = True
+
+    def add(self, user_id, discord_user_id, username, ign_username):
+        # Names compare case-insensitively, like the users table collation
+        for name in (username, ign_username):
+            if name:
+                self._ids_by_name.setdefault(name.casefold(), user_id)
+        if discord_user_id:
+            self._users_by_discord_id[str(discord_user_id)] = (user_id, username, ign_username)
+
+    def remove(self, discord_user_id):
+        user = self._users_by_discord_id.pop(str(discord_user_id), None)
+        if user is None:
+            return
+        user_id, username, ign_username = user
+        for name in (username, ign_username):
+            if name and self._ids_by_name.get(name.casefold()) == user_id:
+                del self._ids_by_name[name.casefold()]
+
+    def lookup(self, name):
+        return self._ids_by_name.get(name.casefold())
+
+    def is_signed_up(self, discord_user_id):
+        return str(discord_user_id) in self._users_by_discord_id
+
+
+user_directory = UserDirectory()
+
+
+# Function to (re)load the user directory from the users table
+async def load_user_directory():
+    async with database.connection() as db:
+        rows = await db.fetchall("SELECT id, discord_user_id, username, ignUsername FROM users")
+    user_directory.load(rows)
+
+
+async def reconcile_user_directory():
+    interval = int(os.getenv('USER_DIRECTORY_RECONCILE_SECONDS', '3600'))
+    while True:
+        try:
+            await load_user_directory()
+        except Exception as e:
+            logger.error(f"Failed to load the user directory: {e}")
+        if interval <= 0 and user_directory.loaded:
+            return
+        await asyncio.sleep(interval if interval > 0 else 60)
+
+
+split_insert_query = ('INSERT INTO loot_splits (user_id, split_amount, split_date, added_by_user_id) '
+                      'VALUES (%s, %s, NOW(), %s)')
+payout_insert_query = ('INSERT INTO payouts (user_id, payout_amount, payout_date, added_by_user_id) '
+                       'VALUES (%s, %s, NOW(), %s)')
+
+
+# Set once user_balances exists and has been seeded; commands that touch balances wait for it
+ledger_ready = False
+ledger_lock = asyncio.Lock()
+
+
+# Function to create the running balance table and seed it from user_totals for users it doesn't know yet; retried by
+# every balance command until it succeeds
+async def setup_ledger():
+    global ledger_ready
+    if ledger_ready:
+        return
+    async with ledger_lock:
+        if ledger_ready:
+            return
+        async with database.connection() as db:
+            await db.execute("CREATE TABLE IF NOT EXISTS user_balances ("
+                             "user_id INT PRIMARY KEY, "
+                             "balance DECIMAL(20, 2) NOT NULL DEFAULT 0)")
+            await db.execute("INSERT IGNORE INTO user_balances (user_id, balance) "
+                             "SELECT user_id, total_amount FROM user_totals")
+            await db.commit()
+        ledger_ready = True
+
+
+# Function to insert loot splits and add them to the running balances in the caller's transaction
+async def credit_splits(db, splits):
+    credits = collections.defaultdict(float)
+    for user_id, split_amount, _ in splits:
+        credits[user_id] += split_amount
+    await db.executemany(split_insert_query, splits)
+    # Rows are locked in user id order so concurrent commands can't deadlock each other
+    await db.executemany("INSERT INTO user_balances (user_id, balance) VALUES (%s, %s) "
+                         "ON DUPLICATE KEY UPDATE balance = balance + VALUES(balance)",
+                         sorted(credits.items()))
+
+
+# Function to pay out the whole balance of each user in the caller's transaction; returns {user_id: amount}
+async def pay_out_balances(db, user_ids, added_by_user_id):
+    ids = sorted(set(user_ids))
+    if not ids:
+        return {}
+    placeholders = ', '.join(['%s'] * len(ids))
+    # FOR UPDATE holds the rows until commit, so a concurrent `add` lands either before or after the payout
+    balances = dict(await db.fetchall(f"SELECT user_id, balance FROM user_balances "
+                                      f"WHERE user_id IN ({placeholders}) ORDER BY user_id FOR UPDATE", ids))
+    if balances:
+        await db.executemany(payout_insert_query, [(user_id, balance, added_by_user_id)
+                                                   for user_id, balance in balances.items()])
+        # Every row exists (it was just locked), so this only takes the update branch; written as an INSERT because
+        # mysql-connector sends an INSERT's rows as one statement but runs an UPDATE once per row
+        await db.executemany("INSERT INTO user_balances (user_id, balance) VALUES (%s, %s) "
+                             "ON DUPLICATE KEY UPDATE balance = balance - VALUES(balance)",
+                             list(balances.items()))
+    return balances
+
+
+# Function to resolve usernames / IGN usernames to user IDs; names missing from the directory take a single query
+async def resolve_user_ids(db, user_names):
+    resolved = {}
+    names = []
+    for name in dict.fromkeys(user_names):
+        user_id = user_directory.lookup(name)
+        if user_id is not None:
+            resolved[name] = user_id
+        else:
+            names.append(name)
+    metrics.increment('cache_requests_total', len(resolved), cache='user_directory', result='hit')
+    metrics.increment('cache_requests_total', len(names), cache='user_directory', result='miss')
+    if not names:
+        return resolved
+    placeholders = ', '.join(['%s'] * len(names))
+    rows = await db.fetchall(f"SELECT id, discord_user_id, username, ignUsername FROM users "
+                             f"WHERE username IN ({placeholders}) OR ignUsername IN ({placeholders})",
+                             names + names)
+
+    # The users table compares names case-insensitively, so match the same way here
+    ids_by_name = {}
+    for user_id, discord_user_id, username, ign_username in rows:
+        # Users added behind the bot's back join the directory on first use
+        user_directory.add(user_id, discord_user_id, username, ign_username)
+        for name in (username, ign_username):
+            if name:
+                ids_by_name.setdefault(name.casefold(), user_id)
+    resolved.update({name: ids_by_name[name.casefold()] for name in names if name.casefold() in ids_by_name})
+    return resolved
 
 
 # Function to format numbers with commas and add a coin emoji
@@ -692,31 +2280,32 @@ def format_number(amount):
 @bot.command(name='signup')
 async def signup(ctx, ign_username: str):
     if member_or_trial(ctx.author):
-        conn = establish_connection_2()
-        if conn:
-            try:
+        if user_directory.is_signed_up(ctx.author.id):
+            await outbound.send(ctx, "You are already signed up!")
+            return
+        try:
+            async with database.connection() as db:
                 # Check if the user is already signed up
-                cursor = conn.cursor()
                 select_query = "SELECT COUNT(*) FROM users WHERE discord_user_id = %s"
-                cursor.execute(select_query, (str(ctx.author.id),))
-                result = cursor.fetchone()
+                result = await db.fetchone(select_query, (str(ctx.author.id),))
                 if result and result[0] > 0:
-                    await ctx.send("You are already signed up!")
+                    reply = "You are already signed up!"
                 else:
                     # Insert user data into the database
                     insert_query = "INSERT INTO users (discord_user_id, username, ignUsername) VALUES (%s, %s, %s)"
-                    cursor.execute(insert_query, (str(ctx.author.id), ctx.author.name, ign_username))
-                    conn.commit()
-                    await ctx.send("You have been successfully signed up!")
-                cursor.close()
-                conn.close()
-            except mysql.connector.Error as err:
-                logger.error("Failed to insert or retrieve user data from the database:", exc_info=True)
-                await ctx.send("An error occurred while signing up. Please try again later.")
-        else:
-            await ctx.send("An error occurred while connecting to the database. Please try again later.")
+                    user_id = await db.insert(insert_query, (str(ctx.author.id), ctx.author.name, ign_username))
+                    await db.commit()
+                    user_directory.add(user_id, ctx.author.id, ctx.author.name, ign_username)
+                    reply = "You have been successfully signed up!"
+            # Reply once the connection is back in the pool
+            await outbound.send(ctx, reply)
+        except DatabaseUnavailable:
+            await outbound.send(ctx, "An error occurred while connecting to the database. Please try again later.")
+        except mysql.connector.Error as err:
+            logger.error("Failed to insert or retrieve user data from the database:", exc_info=True)
+            await outbound.send(ctx, "An error occurred while signing up. Please try again later.")
     else:
-        await ctx.send("Sorry, only members or trials can use this command.")
+        await outbound.send(ctx, "Sorry, only members or trials can use this command.")
 
 
 # Command to allow admins to delete users from the database
@@ -724,40 +2313,143 @@ async def signup(ctx, ign_username: str):
 async def delete_user(ctx, *users: discord.Member):
     # Check if the user invoking the command is an admin
     if ctx.author.guild_permissions.administrator:
-        conn = establish_connection_2()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                deleted_users = []
-                not_found_users = []
-                for user in users:
-                    # Extract user ID from the mention
-                    user_id = str(user.id)
-                    # Check if the user exists in the database
-                    select_query = "SELECT * FROM users WHERE discord_user_id = %s"
-                    cursor.execute(select_query, (user_id,))
-                    result = cursor.fetchone()
-                    if result:
-                        # Delete the user from the database
-                        delete_query = "DELETE FROM users WHERE discord_user_id = %s"
-                        cursor.execute(delete_query, (user_id,))
-                        conn.commit()  # Commit the transaction
+        try:
+            # Extract user IDs from the mentions
+            members = {str(user.id): user for user in users}
+            deleted_users = []
+            not_found_users = []
+            if members:
+                placeholders = ', '.join(['%s'] * len(members))
+                async with database.connection() as db:
+                    # Check which users exist and delete them in one transaction
+                    rows = await db.fetchall(f"SELECT discord_user_id FROM users "
+                                             f"WHERE discord_user_id IN ({placeholders})", list(members))
+                    found = {str(row[0]) for row in rows}
+                    if found:
+                        placeholders = ', '.join(['%s'] * len(found))
+                        await db.execute(f"DELETE FROM users WHERE discord_user_id IN ({placeholders})", list(found))
+                        await db.commit()  # Commit the transaction
+                for user_id, user in members.items():
+                    if user_id in found:
+                        user_directory.remove(user_id)
                         deleted_users.append(user.display_name)
                     else:
                         not_found_users.append(user.display_name)
-                cursor.close()
-                conn.close()
-                if deleted_users:
-                    await ctx.send(f"Users ** {', '.join(deleted_users)} ** have been deleted from the database.")
-                if not_found_users:
-                    await ctx.send(f"Users ** {', '.join(not_found_users)} ** were not found in the database.")
-            except mysql.connector.Error as err:
-                logger.error("Failed to delete users from the database:", exc_info=True)
-                await ctx.send("An error occurred while deleting users from the database. Please try again later.")
-        else:
-            await ctx.send("An error occurred while connecting to the database. Please try again later.")
+            if deleted_users:
+                await outbound.send(ctx, f"Users ** {', '.join(deleted_users)} ** have been deleted from the database.")
+            if not_found_users:
+                await outbound.send(ctx, f"Users ** {', '.join(not_found_users)} ** were not found in the database.")
+        except DatabaseUnavailable:
+            await outbound.send(ctx, "An error occurred while connecting to the database. Please try again later.")
+        except mysql.connector.Error as err:
+            logger.error("Failed to delete users from the database:", exc_info=True)
+            await outbound.send(ctx,
+                                "An error occurred while deleting users from the database. Please try again later.")
+    else:
+        await outbound.send(ctx, "Sorry, only administrators can use this command.")
+
+
+# Function to read (discord_user_id, username, ignUsername) rows from a roster CSV
+def read_roster_csv(data):
+    stream = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8-sig', errors='replace', newline='')
+    first_line = stream.readline()
+    delimiter = max(';', '\t', ',', key=first_line.count)
+    first_row = next(csv.reader([first_line], delimiter=delimiter), [])
+    names = ('discord_user_id', 'username', 'ignusername')
+    header = [column.strip().lower() for column in first_row]
+
+    rows = csv.reader(stream, delimiter=delimiter)
+    if any(name in header for name in names):
+        # Columns the header doesn't name are read as empty
+        columns = [header.index(name) if name in header else None for name in names]
     else:
-        await ctx.send("Sorry, only administrators can use this command.")
+        # Files without a header start with a user, in the default column order
+        columns = list(range(len(names)))
+        rows = itertools.chain([first_row] if first_row else [], rows)
+
+    roster = []
+    for row in rows:
+        roster.append(tuple(row[column].strip() if column is not None and column < len(row) else ''
+                            for column in columns))
+    return roster
+
+
+# Command to allow officers to import a roster from a CSV attachment or from the members of a role
+@bot.command(name='import_roster')
+async def import_roster(ctx, role: discord.Role = None):
+    """
+    Sign up many users at once.
+    Usage: !import_roster @Role, or !import_roster with a CSV attached (discord_user_id, username, ignUsername)
+    """
+    if not check_role(ctx.author):
+        await outbound.send(ctx, "14. You do not have permission to use this command.")
+        return
+
+    try:
+        if role is not None:
+            # Members are signed up with their server nickname as IGN username; that is only a guess, so it never
+            # replaces the IGN username an existing user gave at signup
+            roster = [(str(member.id), member.name, member.display_name) for member in role.members if not member.bot]
+        elif ctx.message.attachments and ctx.message.attachments[0].filename.endswith('.csv'):
+            roster = await cpu_pool.run(read_roster_csv, await ctx.message.attachments[0].read())
+        else:
+            await outbound.send(ctx,
+                                "Please mention a role or attach a CSV file (discord_user_id, username, ignUsername).")
+            return
+
+        # Keep the last row for each Discord user and skip rows we can't sign up
+        entries = {}
+        for discord_user_id, username, ign_username in roster:
+            if discord_user_id.isdigit() and ign_username:
+                entries[discord_user_id] = (username, ign_username)
+        skipped = len(roster) - len(entries)
+
+        inserted = []
+        updated = []
+        if entries:
+            placeholders = ', '.join(['%s'] * len(entries))
+            async with database.connection() as db:
+                existing = {str(discord_user_id): (username, ign_username) for discord_user_id, username, ign_username
+                            in await db.fetchall(f"SELECT discord_user_id, username, ignUsername FROM users "
+                                                 f"WHERE discord_user_id IN ({placeholders})", list(entries))}
+                for discord_user_id, names in entries.items():
+                    if discord_user_id not in existing:
+                        inserted.append((discord_user_id, *names))
+                    elif role is None and existing[discord_user_id] != names:
+                        updated.append((discord_user_id, *names))
+                    else:
+                        skipped += 1
+
+                # One statement each for new and changed users, in a single transaction
+                if inserted:
+                    await db.executemany("INSERT INTO users (discord_user_id, username, ignUsername) "
+                                         "VALUES (%s, %s, %s)", inserted)
+                if updated:
+                    cases = ' '.join(['WHEN %s THEN %s'] * len(updated))
+                    placeholders = ', '.join(['%s'] * len(updated))
+                    await db.execute(f"UPDATE users SET username = CASE discord_user_id {cases} END, "
+                                     f"ignUsername = CASE discord_user_id {cases} END "
+                                     f"WHERE discord_user_id IN ({placeholders})",
+                                     [value for row in updated for value in (row[0], row[1])]
+                                     + [value for row in updated for value in (row[0], row[2])]
+                                     + [row[0] for row in updated])
+                if inserted or updated:
+                    await db.commit()
+                    changed = [row[0] for row in inserted + updated]
+                    placeholders = ', '.join(['%s'] * len(changed))
+                    rows = await db.fetchall(f"SELECT id, discord_user_id, username, ignUsername FROM users "
+                                             f"WHERE discord_user_id IN ({placeholders})", changed)
+                    for user_id, discord_user_id, username, ign_username in rows:
+                        user_directory.remove(discord_user_id)
+                        user_directory.add(user_id, discord_user_id, username, ign_username)
+
+        await outbound.send(ctx, f"Roster imported: **{len(inserted)}** inserted, **{len(updated)}** updated, "
+                                 f"**{skipped}** skipped.")
+    except DatabaseUnavailable:
+        await outbound.send(ctx, "An error occurred while connecting to the database. Please try again later.")
+    except mysql.connector.Error as err:
+        logger.error("Failed to import the roster into the database:", exc_info=True)
+        await outbound.send(ctx, "An error occurred while importing the roster. Please try again later.")
 
 
 @bot.command(name='add')
@@ -766,108 +2458,89 @@ async def add(ctx, *args):
     Add money to the loot split.
     Usage: !add (<amount>) (<user names>) (<tax percentage>)
     """
-    global user_name
     try:
-        conn = establish_connection_2()  # Use the second database for adding to loot split
-        if conn:
-            cursor = conn.cursor()
-
-            # Extract the ID of the user invoking the command and convert it to a string
-            added_by_user_id = str(ctx.author.id)
-
-            # Parse the arguments using regular expressions
-            pattern = r'\((.*?)\)'
-            parsed_args = re.findall(pattern, ' '.join(args))
-
-            if len(parsed_args) != 3:
-                await ctx.send(
-                    "Incorrect usage. Please use the correct format: !add (<amount>) (<user names>) (<tax percentage>)")
-                return
-
-            amount = float(parsed_args[0])
-            user_names = [name.strip() for name in parsed_args[1].split(',')]
-            tax_percentage = int(parsed_args[2])
-
-            split_amount = amount * (1 - (tax_percentage / 100))
+        # Extract the ID of the user invoking the command and convert it to a string
+        added_by_user_id = str(ctx.author.id)
 
-            # Flag to track if at least one user is found
-            user_found = False
-
-            # Fetch user IDs based on usernames and insert into loot_splits table
-            for user_name in user_names:
-                # Fetch user ID from users table based on username
-                cursor.execute("SELECT id FROM users WHERE username = %s OR ignUsername = %s",
-                               (user_name, user_name,))
-                result = cursor.fetchone()
-                if result:
-                    user_found = True
-                    user_id = result[0]
-                    # Insert the split amount for the user into the database
-                    sql = 'INSERT INTO loot_splits (user_id, split_amount, split_date, added_by_user_id) VALUES (%s, %s, NOW(), %s)'
-                    cursor.execute(sql, (user_id, split_amount, added_by_user_id))
-                    conn.commit()
-                else:
-                    await ctx.send(f'User "**{user_names}**" not found.')
+        # Parse the arguments using regular expressions
+        pattern = r'\((.*?)\)'
+        parsed_args = re.findall(pattern, ' '.join(args))
 
-            if user_found:
-                formatted_amount = format_number(split_amount)
-                await ctx.send(f'Money added to **{user_names}** loot split successfully! Amount: {formatted_amount}')
+        if len(parsed_args) != 3:
+            await outbound.send(ctx, "Incorrect usage. Please use the correct format: "
+                                     "!add (<amount>) (<user names>) (<tax percentage>)")
+            return
 
-            cursor.close()
-            conn.close()
-        else:
-            await ctx.send("An error occurred while connecting to the database. Please try again later.")
+        amount = float(parsed_args[0])
+        user_names = [name.strip() for name in parsed_args[1].split(',')]
+        tax_percentage = int(parsed_args[2])
+
+        split_amount = amount * (1 - (tax_percentage / 100))
+
+        # Balances are only credited once they have been seeded, or the seeding would skip these users for good
+        await setup_ledger()
+        async with database.connection() as db:  # Use the second database for adding to loot split
+            # Resolve every name at once and insert all splits in one transaction
+            user_ids = await resolve_user_ids(db, user_names)
+            splits = [(user_ids[user_name], split_amount, added_by_user_id) for user_name in user_names
+                      if user_name in user_ids]
+            if splits:
+                await credit_splits(db, splits)
+                await db.commit()
+
+        for user_name in user_names:
+            if user_name not in user_ids:
+                await outbound.send(ctx, f'User "**{user_name}**" not found.')
+
+        if splits:
+            formatted_amount = format_number(split_amount)
+            await outbound.send(ctx,
+                                f'Money added to **{user_names}** loot split successfully! Amount: {formatted_amount}')
+    except DatabaseUnavailable:
+        await outbound.send(ctx, "An error occurred while connecting to the database. Please try again later.")
     except Exception as e:
-        await ctx.send(f'An error occurred: {e}')
+        await outbound.send(ctx, f'An error occurred: {e}')
 
 
 @bot.command(name='payout')
 async def payout(ctx, *args):
     try:
-        conn = establish_connection_2()  # Use the second database for payouts
-        if conn:
-            cursor = conn.cursor()
+        # Parse the arguments using regular expressions
+        pattern = r'\((.*?)\)'
+        parsed_args = re.findall(pattern, ' '.join(args))
 
-            # Parse the arguments using regular expressions
-            pattern = r'\((.*?)\)'
-            parsed_args = re.findall(pattern, ' '.join(args))
-
-            # Check if the arguments are provided in the correct format
-            if len(parsed_args) != 1:
-                await ctx.send("Incorrect usage. Please use the correct format: !payout (<user names>)")
-                return
-
-            user_names = [name.strip() for name in parsed_args[0].split(',')]
+        # Check if the arguments are provided in the correct format
+        if len(parsed_args) != 1:
+            await outbound.send(ctx, "Incorrect usage. Please use the correct format: !payout (<user names>)")
+            return
 
-            for user_name in user_names:
-                # Fetch the user ID from the users table based on the username
-                cursor.execute("SELECT id FROM users WHERE username = %s OR ignUsername = %s",
-                               (user_name, user_name,))
-                result = cursor.fetchone()
-                if result:
-                    user_id = result[0]
+        user_names = [name.strip() for name in parsed_args[0].split(',')]
 
-                    # Fetch the total amount from user_totals
-                    cursor.execute("SELECT total_amount FROM user_totals WHERE user_id = %s", (user_id,))
-                    total_amount = cursor.fetchone()[0]
+        await setup_ledger()
+        async with database.connection() as db:  # Use the second database for payouts
+            user_ids = await resolve_user_ids(db, user_names)
 
-                    # Insert the payout details into the payouts table
-                    sql = ('INSERT INTO payouts (user_id, payout_amount, payout_date, added_by_user_id) '
-                           'VALUES (%s, %s, NOW(), %s)')
-                    cursor.execute(sql, (user_id, total_amount, str(ctx.author.id)))
-                    conn.commit()
+            # Pay out each user's running balance once, in one transaction
+            totals = await pay_out_balances(db, user_ids.values(), str(ctx.author.id))
+            await db.commit()
 
-                    formatted_amount = format_number(total_amount)
-                    await ctx.send(f'Payout of {formatted_amount} made to user "**{user_name}**" successfully!')
-                else:
-                    await ctx.send(f'User "**{user_name}**" not found.')
+        payouts = {}
+        for user_name, user_id in user_ids.items():
+            if user_id in totals and user_id not in payouts.values():
+                payouts[user_name] = user_id
 
-            cursor.close()
-            conn.close()
-        else:
-            await ctx.send("An error occurred while connecting to the database. Please try again later.")
+        for user_name in user_names:
+            if user_name in payouts:
+                formatted_amount = format_number(totals[payouts[user_name]])
+                await outbound.send(ctx, f'Payout of {formatted_amount} made to user "**{user_name}**" successfully!')
+            elif user_name in user_ids:
+                await outbound.send(ctx, f'No total amount found for user "**{user_name}**".')
+            else:
+                await outbound.send(ctx, f'User "**{user_name}**" not found.')
+    except DatabaseUnavailable:
+        await outbound.send(ctx, "An error occurred while connecting to the database. Please try again later.")
     except Exception as e:
-        await ctx.send(f'An error occurred: {e}')
+        await outbound.send(ctx, f'An error occurred: {e}')
 
 
 @bot.command(name='ball')
@@ -877,223 +2550,341 @@ async def check_total_amount(ctx, user_name: str):
     Usage: !ball <user name>
     """
     try:
-        conn = establish_connection_2()  # Assuming this function establishes a connection to your database
-        if conn:
-            cursor = conn.cursor()
-
-            # Fetch user ID from users table based on username
-            cursor.execute("SELECT id FROM users WHERE username = %s OR ignUsername = %s", (user_name, user_name,))
-            result = cursor.fetchone()
-
-            if result:
-                user_id = result[0]
-
-                # Fetch total amount from user_totals table based on user ID
-                cursor.execute("SELECT total_amount FROM user_totals WHERE user_id = %s", (user_id,))
-                result = cursor.fetchone()
-
-                if result:
-                    total_amount = result[0]
-                    formatted_amount = format_number(total_amount)
-                    await ctx.send(f'Total amount for user ** {user_name} **: {formatted_amount}')
-                else:
-                    await ctx.send(f'No total amount found for user ** {user_name} **.')
-            else:
-                await ctx.send(f'User ** {user_name} ** not found.')
-
-            cursor.close()
-            conn.close()
+        await setup_ledger()
+        async with database.connection() as db:
+            # Fetch user ID from the user directory based on username
+            user_id = (await resolve_user_ids(db, [user_name])).get(user_name)
+
+            if user_id is not None:
+                # Fetch the running balance based on user ID
+                result = await db.fetchone("SELECT balance FROM user_balances WHERE user_id = %s", (user_id,))
+
+        if user_id is None:
+            await outbound.send(ctx, f'User ** {user_name} ** not found.')
+        elif result:
+            total_amount = result[0]
+            formatted_amount = format_number(total_amount)
+            await outbound.send(ctx, f'Total amount for user ** {user_name} **: {formatted_amount}')
         else:
-            await ctx.send("An error occurred while connecting to the database. Please try again later.")
+            await outbound.send(ctx, f'No total amount found for user ** {user_name} **.')
+    except DatabaseUnavailable:
+        await outbound.send(ctx, "An error occurred while connecting to the database. Please try again later.")
     except Exception as e:
-        await ctx.send(f'An error occurred: {e}')
+        await outbound.send(ctx, f'An error occurred: {e}')
 
 
-# Function to get participant names from the provided battle board URL
-def get_participant_names(json_data):
-    try:
-        data = json.loads(json_data)
-        participant_names = []
+# Guilds whose members are paid by `add_link`, comma separated in BATTLE_GUILDS
+battle_guilds = {guild.strip().lower() for guild in os.getenv('BATTLE_GUILDS', 'smurfing monkeys').split(',')
+                 if guild.strip()}
 
-        if 'players' in data:
-            players = data['players']
-            for player_id, player_info in players.items():
-                if 'name' in player_info and 'guildName' in player_info:
-                    guild_name = player_info['guildName'].lower()
-                    if guild_name == 'smurfing monkeys':
-                        participant_names.append(player_info['name'])
 
-        return participant_names
+# Function to pull (name, guild name) pairs out of a battle board JSON document
+def get_battle_players(json_data):
+    try:
+        data = json.loads(json_data)
+        return tuple((player_info['name'], player_info['guildName'] or '')
+                     for player_info in data.get('players', {}).values()
+                     if 'name' in player_info and 'guildName' in player_info)
     except Exception as e:
         raise ValueError("An error occurred: " + str(e))
 
 
-# Function to convert public link to API link
-def convert_public_link_to_api_link(public_link):
-    # Split the public link by '/'
-    parts = public_link.split('/')
-    # Extract the battle ID from the last part of the URL
-    battle_id = parts[-1]
-    # Construct the API link using the battle ID
-    api_link = f"https://gameinfo.albiononline.com/api/gameinfo/battles/{battle_id}"
-    return api_link
+# Function to get the names of the players from our guilds
+def get_participant_names(players, guilds=None):
+    guilds = battle_guilds if guilds is None else guilds
+    return list(dict.fromkeys(name for name, guild_name in players if guild_name.lower() in guilds))
 
 
-# Command to fetch participant names from the provided link and add them to the database
-@bot.command(name='add_link')
-async def get_link(ctx, amount: int, link: str):
-    try:
-        api_link = convert_public_link_to_api_link(link)
-        response = requests.get(api_link)
-        if response.status_code == 200:
-            participant_names = get_participant_names(response.text)
-
-            if participant_names:
-                conn = establish_connection_2()  # Use the second database for adding to loot split
-                if conn:
-                    cursor = conn.cursor()
-                    added_by_user_id = str(ctx.author.id)
-                    tax_percentage = 0  # Assuming no tax for simplicity
-
-                    split_amount = amount * (1 - (tax_percentage / 100))
-
-                    for user_name in participant_names:
-                        # Fetch user ID from users table based on username
-                        cursor.execute("SELECT id FROM users WHERE username = %s OR ignUsername = %s",
-                                       (user_name, user_name,))
-                        result = cursor.fetchone()
-                        if result:
-                            user_id = result[0]
-                            # Insert the split amount for the user into the database
-                            sql = 'INSERT INTO loot_splits (user_id, split_amount, split_date, added_by_user_id) VALUES (%s, %s, NOW(), %s)'
-                            cursor.execute(sql, (user_id, split_amount, added_by_user_id))
-                            conn.commit()
-                            # Send a message for each user added to the database
-                            formatted_amount = format_number(split_amount)
-                            await ctx.send(
-                                f"Money added to **{user_name}'s** loot split successfully! Amount: {formatted_amount}")
-                        else:
-                            await ctx.send(f'User **{user_name}** not found in the database.')
-
-                    cursor.close()
-                    conn.close()
-                else:
-                    await ctx.send("An error occurred while connecting to the database. Please try again later.")
-            else:
-                await ctx.send("No participant names found in the provided link.")
-        else:
-            await ctx.send("Failed to fetch battle board data. Please check the link and try again.")
-    except Exception as e:
-        await ctx.send(f'An error occurred: {e}')
+# Function to extract the battle ID from a public battle board link
+def battle_id_from_link(public_link):
+    # The battle ID is the last part of the URL
+    return public_link.split('?')[0].rstrip('/').split('/')[-1]
 
 
-# Function to retrieve all logs from the spreadsheet and sort them by total amount
-def get_all_logs(spreadsheet_key):
-    try:
-        # Authenticate with Google Sheets
-        client = authenticate()
+class BattleBoardError(Exception):
+    pass
 
-        # Open the spreadsheet using the provided key
-        spreadsheet = client.open_by_key(spreadsheet_key)
-        sheet = spreadsheet.sheet1
-        all_values = sheet.get_all_values()
 
-        # Create a dictionary to store the total amount for each unique name
-        user_logs = {}
+class BattleBoardClient:
+    """Async client for the Albion battle API.
 
-        # Iterate over each row in the spreadsheet
-        for row in all_values[1:]:
-            # Check if the row is empty or if the 'Amount' column is not numeric
-            if not row or not row[5].isdigit():
-                continue
+    One pooled aiohttp session is shared by every request; each request has a timeout and is retried with
+    exponential backoff on 429 and 5xx responses. Responses are parsed as they stream in (with ijson when it is
+    installed), keeping only each player's name and guild. Finished battles never change, so the players are kept
+    in an LRU cache keyed by battle ID and concurrent requests for the same battle share one fetch.
+    """
 
-            # Extract the player name and player guild from the row
-            player_name = row[1]
-            player_guild = row[6]
+    api_url = "https://gameinfo.albiononline.com/api/gameinfo/battles/{battle_id}"
+
+    def __init__(self, timeout=15, retries=3, backoff=1.0, cache_size=256):
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._retries = retries
+        self._backoff = backoff
+        self._cache_size = cache_size
+        self._cache = collections.OrderedDict()
+        self._inflight = {}
+        self._session = None
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=self._timeout,
+                                                  connector=aiohttp.TCPConnector(limit=10, ttl_dns_cache=300))
+        return self._session
+
+    async def get_players(self, battle_id):
+        """Return ``(name, guild name)`` for every player in a battle."""
+        if battle_id in self._cache:
+            metrics.increment('cache_requests_total', cache='battle_board', result='hit')
+            self._cache.move_to_end(battle_id)
+            return self._cache[battle_id]
+        metrics.increment('cache_requests_total', cache='battle_board', result='miss')
+        task = self._inflight.get(battle_id)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._fetch(battle_id))
+            task.add_done_callback(lambda _: self._inflight.pop(battle_id, None))
+            self._inflight[battle_id] = task
+        return await asyncio.shield(task)
+
+    async def _fetch(self, battle_id):
+        url = self.api_url.format(battle_id=battle_id)
+        for attempt in range(self._retries + 1):
+            delay = self._backoff * 2 ** attempt
+            started = time.perf_counter()
+            try:
+                async with self._get_session().get(url) as response:
+                    metrics.increment('http_requests_total', target='battle_board', status=response.status)
+                    if response.status == 200:
+                        players = await self._read_players(response)
+                        self._remember(battle_id, players)
+                        return players
+                    if response.status != 429 and response.status < 500:
+                        raise BattleBoardError(f"Battle board returned HTTP {response.status}")
+                    retry_after = response.headers.get('Retry-After')
+                    if retry_after and retry_after.isdigit():
+                        delay = max(delay, int(retry_after))
+                    error = BattleBoardError(f"Battle board returned HTTP {response.status}")
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                error = BattleBoardError(f"Battle board request failed: {e!r}")
+            finally:
+                metrics.observe('http_request_duration_seconds', time.perf_counter() - started, target='battle_board')
+            if attempt < self._retries:
+                await asyncio.sleep(delay)
+        raise error
+
+    @staticmethod
+    async def _read_players(response):
+        if ijson is None:
+            return await cpu_pool.run(get_battle_players, await response.text())
+        try:
+            return tuple([(player_info['name'], player_info.get('guildName') or '')
+                          async for _, player_info in ijson.kvitems_async(response.content, 'players')
+                          if 'name' in player_info])
+        except ijson.JSONError as e:
+            raise ValueError(f"Invalid battle board response: {e}") from e
 
-            # Convert the 'Amount' column to an integer
-            amount = int(row[5])
+    def _remember(self, battle_id, players):
+        self._cache[battle_id] = players
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
 
-            # Add the player name to the user_logs dictionary if it doesn't exist
-            if player_name not in user_logs:
-                user_logs[player_name] = 0
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
 
-            # Add the player guild name to the user_logs dictionary if it doesn't exist
-            if player_guild not in user_logs:
-                user_logs[player_guild] = 0
 
-            # Increment the total amount for the player name and player guild
-            user_logs[player_name] += amount
-            user_logs[player_guild] += amount
+battle_board = BattleBoardClient()
 
-        # Sort the dictionary by total amount (ascending order)
-        sorted_user_logs = dict(sorted(user_logs.items(), key=lambda item: item[1]))
 
-        return sorted_user_logs
+# Command to fetch participant names from one or more battle links and add them to the database
+@bot.command(name='add_link')
+async def get_link(ctx, amount: int, *links: str):
+    """
+    Pay every guild member that took part in the linked battles; amount is paid once per battle attended.
+    Usage: !add_link <amount> <link> [<link> ...]
+    """
+    try:
+        if not links:
+            await outbound.send(
+                ctx, "Incorrect usage. Please use the correct format: !add_link <amount> <link> [<link> ...]")
+            return
 
+        # Fetch every battle at once
+        battle_ids = list(dict.fromkeys(battle_id_from_link(link) for link in links))
+        results = await asyncio.gather(*(battle_board.get_players(battle_id) for battle_id in battle_ids),
+                                       return_exceptions=True)
+
+        # Count how many of the battles each player took part in
+        participation = collections.Counter()
+        failed_battles = []
+        for battle_id, players in zip(battle_ids, results):
+            if isinstance(players, Exception):
+                logger.error(f"Failed to fetch battle {battle_id}: {players}")
+                failed_battles.append(battle_id)
+            else:
+                participation.update(get_participant_names(players))
+
+        if failed_battles:
+            await outbound.send(ctx, f"Failed to fetch battle board data for {', '.join(failed_battles)}. "
+                                     f"Please check the link and try again.")
+            if len(failed_battles) == len(battle_ids):
+                return
+
+        if participation:
+            added_by_user_id = str(ctx.author.id)
+            tax_percentage = 0  # Assuming no tax for simplicity
+
+            split_amount = amount * (1 - (tax_percentage / 100))
+            participant_names = list(participation)
+
+            await setup_ledger()
+            async with database.connection() as db:  # Use the second database for adding to loot split
+                # Resolve every participant at once and insert all splits in one transaction
+                user_ids = await resolve_user_ids(db, participant_names)
+                if user_ids:
+                    await credit_splits(db, [(user_id, split_amount * participation[user_name], added_by_user_id)
+                                             for user_name, user_id in user_ids.items()])
+                    await db.commit()
+
+            for user_name in participant_names:
+                if user_name in user_ids:
+                    # Send a message for each user added to the database
+                    formatted_amount = format_number(split_amount * participation[user_name])
+                    battles = f" ({participation[user_name]} battles)" if len(battle_ids) > 1 else ""
+                    await outbound.send(ctx, f"Money added to **{user_name}'s** loot split successfully! "
+                                             f"Amount: {formatted_amount}{battles}")
+                else:
+                    await outbound.send(ctx, f'User **{user_name}** not found in the database.')
+        else:
+            await outbound.send(ctx, "No participant names found in the provided link.")
+    except DatabaseUnavailable:
+        await outbound.send(ctx, "An error occurred while connecting to the database. Please try again later.")
     except Exception as e:
-        logging.error(f"Error retrieving logs: {e}")
-        return None
+        await outbound.send(ctx, f'An error occurred: {e}')
+
+
+# Function to get the player or guild leaderboard of the cached loot log
+def get_all_logs(loot_log, guilds=False):
+    return loot_log.guilds if guilds else loot_log.players
 
 
 user_logger = "1ZKroN93892iTp8WfgcHT75uIFDflsJGvtafN8MSj6i8"  # Spreadsheet key
+# Spreadsheet keys are far longer than any player or guild name
+spreadsheet_key_pattern = re.compile(r'[A-Za-z0-9_-]{40,}')
 
 
 @bot.command(name='total_logger')
-async def get_all_user_logs(ctx, spreadsheet_key=user_logger):
-    from tabulate import tabulate
+async def get_all_user_logs(ctx, *args):
+    """
+    Show the loot-log leaderboard.
+    Usage: !total_logger [spreadsheet_key] [guilds] [top <n>] [page <n>] | !total_logger [guilds] rank <name>
+    """
     try:
-        # Get all logs from the spreadsheet
-        all_logs = get_all_logs(spreadsheet_key)
-        if all_logs:
-            # Sort the dictionary by total amount (ascending order)
-            sorted_user_logs = dict(sorted(all_logs.items(), key=lambda item: item[1]))
-
-            # Format logs as a table using tabulate
-            table = [["User", "Total Amount"]]
-            for username, total_amount in sorted_user_logs.items():
-                table.append([username, total_amount])
-
-            # Format the table with tabulate
-            formatted_table = tabulate(table, headers='firstrow', tablefmt='fancy_grid')
-
-            # Paginate the formatted table
-            message_chunks = split_message_chunks(formatted_table)
-
-            # Send the paginated message
-            current_page = 0
-            message = await ctx.send(
-                f"```Page {current_page + 1}/{len(message_chunks)}\n{message_chunks[current_page]}```")
-
-            # Add pagination reactions
-            await message.add_reaction('⬅️')
-            await message.add_reaction('➡️')
-
-            # Pagination loop
-            while True:
-                try:
-                    reaction, user = await bot.wait_for('reaction_add',
-                                                        check=lambda r, u: u == ctx.author and str(r.emoji) in ['⬅️',
-                                                                                                                '➡️'])
+        args = list(args)
+        # Another loot-log spreadsheet can be named first, as before
+        spreadsheet_key = args.pop(0) if args and spreadsheet_key_pattern.fullmatch(args[0]) else user_logger
+        guilds = bool(args) and args[0].lower() in ('guild', 'guilds')
+        if guilds:
+            args.pop(0)
+        namespace = "Guild" if guilds else "User"
+
+        # Get the leaderboard from the cached loot log
+        leaderboard = get_all_logs(await get_loot_log(spreadsheet_key), guilds=guilds)
+        if not leaderboard:
+            await outbound.send(ctx, "No logs found in the spreadsheet.")
+            return
 
-                    if str(reaction.emoji) == '⬅️':
-                        current_page = max(0, current_page - 1)
-                    elif str(reaction.emoji) == '➡️':
-                        current_page = min(len(message_chunks) - 1, current_page + 1)
+        if args and args[0].lower() == 'rank' and len(args) > 1:
+            entry = leaderboard.rank(' '.join(args[1:]))
+            if entry is None:
+                await outbound.send(ctx, f"** {' '.join(args[1:])} ** is not on the leaderboard.")
+            else:
+                rank, name, total_amount = entry
+                await outbound.send(ctx, f"** {name} ** is ranked **#{rank}** of {len(leaderboard)} with "
+                                         f"{format_number(total_amount)}")
+            return
 
-                    # Update the message with the new page
-                    await message.edit(
-                        content=f"```Page {current_page + 1}/{len(message_chunks)}\n{message_chunks[current_page]}```")
-                    await reaction.remove(user)
+        count = None
+        page = 1
+        while len(args) >= 2 and args[0].lower() in ('top', 'page') and args[1].isdigit():
+            if args[0].lower() == 'top':
+                count = int(args[1])
+            else:
+                page = int(args[1])
+            args = args[2:]
+        if args:
+            await outbound.send(ctx, "Incorrect usage. Please use the correct format: !total_logger [guilds] "
+                                     "[top <n>] [page <n>] or !total_logger [guilds] rank <name>")
+            return
 
-                except Exception as e:
-                    await ctx.send(f"An error occurred: {e}")
+        # Keep the rows and render each page only when it is shown
+        paginator = await cpu_pool.run(TablePaginator, leaderboard.top(count), ["#", namespace, "Total Amount"])
 
-        else:
-            await ctx.send("No logs found in the spreadsheet.")
+        # Send the paginated message; the registry handles the ⬅️/➡️ reactions
+        await paginations.start(ctx, paginator, page=min(page, paginator.page_count) - 1)
 
     except Exception as e:
-        await ctx.send(f"An error occurred: {e}")
+        await outbound.send(ctx, f"An error occurred: {e}")
+
+
+metrics.gauge('countdowns_live', lambda: len(countdown_scheduler))
+metrics.gauge('pagination_sessions', lambda: len(paginations))
+metrics.gauge('discord_actions_queued', lambda: len(outbound))
+metrics.gauge('event_loop_lag_last_seconds', lambda: f"{event_loop_lag:.6f}")
+metrics.gauge('event_loop_lag_max_seconds', lambda: f"{event_loop_lag_max:.6f}")
+metrics.gauge('event_listeners', lambda: sum(len(listeners) for listeners in bot.extra_events.values()))
+metrics.gauge('wait_for_listeners',
+              lambda: sum(len(listeners) for listeners in getattr(bot, '_listeners', {}).values()))
+for blocking_pool in (network_pool, cpu_pool, disk_pool, database.threads):
+    metrics.gauge(f'blocking_pool_pending{{pool="{blocking_pool.name}"}}', lambda pool=blocking_pool: pool.pending)
+
+
+# Command to allow administrators to see command latencies, event-loop lag and cache hit rates
+@bot.command(name='metrics')
+async def show_metrics(ctx):
+    if not ctx.author.guild_permissions.administrator:
+        await outbound.send(ctx, "Sorry, only administrators can use this command.")
+        return
+
+    # Histogram quantiles are bucket upper bounds, so they read as "at most"
+    def milliseconds(seconds):
+        return "∞" if seconds == float('inf') else f"{seconds * 1000:.0f}"
+
+    per_command = {}
+    for (name, labels), histogram in metrics.histograms.items():
+        if name != 'command_duration_seconds':
+            continue
+        labels = dict(labels)
+        row = per_command.setdefault(labels['command'], [labels['command'], 0, 0, 0.0, Histogram()])
+        row[1] += histogram.count
+        if labels['status'] == 'error':
+            row[2] += histogram.count
+        row[3] += histogram.sum
+        for index, count in enumerate(histogram.counts):
+            row[4].counts[index] += count
+        row[4].count += histogram.count
+
+    rows = [[command, count, errors, f"{total / count * 1000:.0f}", milliseconds(merged.quantile(0.5)),
+             milliseconds(merged.quantile(0.95))]
+            for command, count, errors, total, merged in sorted(per_command.values())]
+    table = tabulate.tabulate(rows, headers=["Command", "Calls", "Errors", "Avg ms", "p50 ms", "p95 ms"])
+
+    lag = metrics.histograms.get(('event_loop_lag_seconds', ()), Histogram())
+    lines = [
+        f"Event-loop lag: last {event_loop_lag * 1000:.1f} ms, p99 ≤ {milliseconds(lag.quantile(0.99))} ms, "
+        f"max {event_loop_lag_max * 1000:.1f} ms",
+        f"Live countdowns: {len(countdown_scheduler)}, pagination sessions: {len(paginations)}",
+    ]
+    for label, name in (("DB calls", 'db_call_duration_seconds'), ("HTTP calls", 'http_request_duration_seconds')):
+        histograms = [histogram for (key, _), histogram in metrics.histograms.items() if key == name]
+        count = sum(histogram.count for histogram in histograms)
+        total = sum(histogram.sum for histogram in histograms)
+        lines.append(f"{label}: {count}, avg {total / count * 1000 if count else 0:.0f} ms")
+    for cache in ('loot_log', 'battle_board', 'table_page', 'user_directory'):
+        hit_rate = metrics.hit_rate(cache)
+        lines.append(f"Cache {cache}: {'n/a' if hit_rate is None else f'{hit_rate:.0%}'} hits")
+
+    for chunk in split_message_chunks(table + "\n\n" + "\n".join(lines)):
+        await outbound.send(ctx, f"```{chunk}```", kind='metrics')
 
 
 @bot.command(name='helpp')
@@ -1116,6 +2907,12 @@ async def help_command(ctx):
         inline=False
     )
 
+    embed.add_field(
+        name="__**!import_roster <@role> | CSV attachment**__",
+        value="Allows officers to sign up a whole role or a CSV roster (discord_user_id, username, ignUsername).",
+        inline=False
+    )
+
     embed.add_field(
         name="__**!add ( <amount> <user_names> <tax_percentage> )**__ ",
         value="Add money to the loot split.",
@@ -1135,12 +2932,30 @@ async def help_command(ctx):
     )
 
     embed.add_field(
-        name="__**!add_link <amount> <link>**__",
-        value="Fetch participant names from the provided link and add them to the database.",
+        name="__**!add_link <amount> <link> [<link> ...]**__",
+        value="Fetch participant names from one or more battle links and add them to the database.",
+        inline=False
+    )
+
+    embed.add_field(
+        name="__**!log <player> [items]**__",
+        value="Show a player's loot-log entries, or their totals per item with `items`. Names may be abbreviated.",
+        inline=False
+    )
+
+    embed.add_field(
+        name="__**!total_logger [spreadsheet_key] [guilds] [top <n>] [page <n>]**__",
+        value="Show the loot-log leaderboard for players or guilds. Use `rank <name>` to look up one entry.",
+        inline=False
+    )
+
+    embed.add_field(
+        name="__**!metrics**__",
+        value="Allows administrators to see command latencies, event-loop lag and cache hit rates.",
         inline=False
     )
 
-    await ctx.send(embed=embed)
+    await outbound.send(ctx, embed=embed)
 
 
 if __name__ == "__main__":
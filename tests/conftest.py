@@ -0,0 +1,23 @@
+import importlib
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+
+@pytest.fixture(scope='session')
+def bot_module(tmp_path_factory):
+    for dependency in ('aiohttp', 'discord', 'dotenv', 'gspread', 'mysql.connector', 'oauth2client', 'tabulate'):
+        pytest.importorskip(dependency)
+
+    # The module opens error.log in the working directory when it is imported
+    log_dir = tmp_path_factory.mktemp('bot')
+    cwd = Path.cwd()
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    try:
+        os.chdir(log_dir)
+        return importlib.import_module('ByteEmily_fileFinalVersion')
+    finally:
+        os.chdir(cwd)
+        sys.path.pop(0)
@@ -0,0 +1,13 @@
+def test_headerless_roster_uses_default_columns(bot_module):
+    data = b"123,bob,Bobby\n456,al,Al\n"
+    assert bot_module.read_roster_csv(data) == [('123', 'bob', 'Bobby'), ('456', 'al', 'Al')]
+
+
+def test_full_header_roster_maps_columns_by_name(bot_module):
+    data = b"\xef\xbb\xbfUsername;ignUsername;Discord_User_ID\nbob;Bobby;123\nal;Al;456\n"
+    assert bot_module.read_roster_csv(data) == [('123', 'bob', 'Bobby'), ('456', 'al', 'Al')]
+
+
+def test_partial_header_roster_reads_missing_columns_as_empty(bot_module):
+    data = b"ignUsername,discord_user_id\nb,1\n"
+    assert bot_module.read_roster_csv(data) == [('1', '', 'b')]
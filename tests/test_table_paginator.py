@@ -0,0 +1,49 @@
+import random
+
+
+def first_cells(table, headers):
+    # The first column of every body line; continuation lines of multiline rows leave it blank
+    cells = [line.split('│')[1].strip() for line in table.split('\n') if line.startswith('│')]
+    header_lines = max(str(header).count('\n') + 1 for header in headers)
+    return [cell for cell in cells[header_lines:] if cell]
+
+
+def assert_pages_fit(paginator, rows, headers):
+    shown = []
+    for page in range(paginator.page_count):
+        table = paginator.render_page(page)
+        assert len(table) <= paginator.max_chars
+        assert not table.endswith("…")
+        shown.extend(first_cells(table, headers))
+    # Every row is on exactly one page, in order
+    assert shown == [str(row[0]) for row in rows]
+
+
+def test_leaderboard_pages_fit(bot_module):
+    rng = random.Random(3)
+    rows = [(rank, f"Player{rank}", rng.randint(0, 10 ** 9)) for rank in range(1, 3001)]
+    headers = ["#", "Player", "Total Amount"]
+    paginator = bot_module.TablePaginator(rows, headers)
+    assert paginator.page_count > 1
+    assert_pages_fit(paginator, rows, headers)
+
+
+def test_log_pages_fit(bot_module):
+    rng = random.Random(5)
+    rows = [["Total amount", "", "**123456**"]]
+    rows += [[f"T{rng.randint(4, 8)}_BAG_{index}", str(rng.randint(0, 4)), str(rng.randint(1, 10 ** 6))]
+             for index in range(500)]
+    headers = ["Item", "Enchantment", "Amount"]
+    assert_pages_fit(bot_module.TablePaginator(rows, headers), rows, headers)
+
+
+def test_decimal_aligned_and_multiline_pages_fit(bot_module):
+    rng = random.Random(7)
+    rows = []
+    for index in range(800):
+        amount = rng.choice([rng.randint(0, 10 ** 7), round(rng.uniform(0, 10 ** 7), rng.randint(1, 4)),
+                             rng.uniform(0, 1)])
+        name = "\n".join(f"line{line}" for line in range(rng.randint(1, 3)))
+        rows.append([index, name, amount])
+    headers = ["n", "Name\nof player", "A"]
+    assert_pages_fit(bot_module.TablePaginator(rows, headers), rows, headers)